@@ -0,0 +1,74 @@
+"""Compare the speed of the JSON encoders when writing large reports.
+
+Usage: python benchmarks/bench_encoders.py [--sizes 10000 100000] [--indent N]
+
+Encoders whose package is not installed are skipped.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic import make_report
+
+from pytest_json_report import encoders, writers
+
+
+def bench(report, encoder, indent, repeat):
+    """Return the best time of writing `report` `repeat` times, and the file size."""
+    best = float("inf")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "report.json"
+        for _ in range(repeat):
+            start = time.perf_counter()
+            writers.write_report(writers.JSONWriter(path, indent=indent, encoder=encoder), report)
+            best = min(best, time.perf_counter() - start)
+        return best, path.stat().st_size
+
+
+def bench_json_dump(report, indent, repeat):
+    """Return the best time of `json.dump()`, as used before encoders were added."""
+    best = float("inf")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "report.json"
+        for _ in range(repeat):
+            start = time.perf_counter()
+            with path.open("w", encoding="utf-8") as f:
+                json.dump(report, f, default=str, indent=indent)
+            best = min(best, time.perf_counter() - start)
+        return best, path.stat().st_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--indent", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        report = make_report(size, num_log_records=2)
+        seconds, nbytes = bench_json_dump(report, args.indent, args.repeat)
+        results.append({"tests": size, "encoder": "json.dump", "seconds": seconds, "bytes": nbytes})
+        for name in encoders.ENCODERS:
+            try:
+                encoder = encoders.get_encoder(name)
+            except ImportError:
+                continue
+            seconds, nbytes = bench(report, encoder, args.indent, args.repeat)
+            results.append({"tests": size, "encoder": name, "seconds": seconds, "bytes": nbytes})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'tests':>8} {'encoder':>10} {'seconds':>9} {'MB':>8}")
+    for r in results:
+        print(f"{r['tests']:>8} {r['encoder']:>10} {r['seconds']:>9.3f} {r['bytes'] / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
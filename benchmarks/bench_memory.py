@@ -0,0 +1,88 @@
+"""Measure the memory used per test by the in-memory test records.
+
+Usage: python benchmarks/bench_memory.py [--tests N] [--failure-rate R]
+
+The test items are built from fake reports with `serialize.make_testitem()`
+and `serialize.make_teststage()`, like the plugin does. The dict
+representation (`TestItem.to_dict()`) is what was kept in memory before the
+slotted record types were introduced. Strings are shared between both
+representations, so only the container overhead is compared.
+"""
+
+import argparse
+import random
+import tracemalloc
+from types import SimpleNamespace
+
+from pytest_json_report import serialize
+
+
+def make_fake_reports(i, failed):
+    """Return fake setup/call/teardown reports of test number `i`."""
+    path = f"tests/pkg{i % 100}/test_mod{i % 1000}.py"
+    reports = []
+    for when in serialize.STAGES:
+        report = SimpleNamespace(
+            when=when, duration=random.random(), outcome="passed", longrepr=None, longreprtext=""
+        )
+        if failed and when == "call":
+            entries = [
+                SimpleNamespace(reprfileloc=SimpleNamespace(path=path, lineno=40, message="")),
+                SimpleNamespace(
+                    reprfileloc=SimpleNamespace(path=path, lineno=42, message="AssertionError")
+                ),
+            ]
+            report.outcome = "failed"
+            report.longrepr = SimpleNamespace(
+                reprcrash=SimpleNamespace(path=path, lineno=42, message="assert 1 == 2"),
+                reprtraceback=SimpleNamespace(reprentries=entries),
+            )
+            report.longreprtext = f"E       assert 1 == 2\n\n{path}:42: AssertionError"
+        reports.append(report)
+    return reports
+
+
+def build(inputs):
+    items = []
+    for i, (nodeid, keywords, reports) in enumerate(inputs):
+        item = serialize.make_testitem(nodeid, keywords, (None, i, None))
+        for report in reports:
+            stage = serialize.make_teststage(report, None, None, None, omit_traceback=False)
+            item.set_stage(report.when, stage)
+        items.append(item)
+    return items
+
+
+def measure(func, *args):
+    """Return the result of `func(*args)` and the bytes allocated by it."""
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tests", type=int, default=100_000)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    inputs = []
+    for i in range(args.tests):
+        nodeid = f"tests/test_mod{i % 1000}.py::test_func[{i}]"
+        keywords = [f"test_func[{i}]", f"test_mod{i % 1000}.py", "parametrize"]
+        inputs.append((nodeid, keywords, make_fake_reports(i, rng.random() < args.failure_rate)))
+
+    items, records_size = measure(build, inputs)
+    _, dicts_size = measure(lambda: [item.to_dict() for item in items])
+    print(f"tests: {args.tests}, failure rate: {args.failure_rate}")
+    print(f"dicts (before):          {dicts_size / args.tests:7.1f} bytes per test")
+    print(f"slotted records (after): {records_size / args.tests:7.1f} bytes per test")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Measure how the plugin's cost scales with the size of the test suite.
+
+Usage: python benchmarks/bench_scaling.py [--sizes 10000 100000 1000000]
+       [--failure-rate R] [--log-records N] [--stdout-size N] [--metadata-size N]
+       [--workers N] [--output results.json] [--compare baseline.json]
+
+A synthetic test suite of each size is generated, with the given rate of
+failing tests, number of log records, bytes of stdout and number of
+metadata keys per test. Each suite is run in a subprocess in these scenarios:
+
+- baseline: without `--json-report`
+- report: with `--json-report`
+- summary: with `--json-report --json-report-summary`
+- xdist: with `--json-report -n WORKERS` (skipped if pytest-xdist isn't installed)
+
+For each run, the wall time, the peak RSS of the largest process (the pytest
+process or an xdist worker) and, with a report, its size, the time taken to
+write it and the time spent in the plugin's hooks (see
+`--json-report-overhead`) are recorded. The results are written as JSON to
+`--output`. With `--compare`, the results are compared to those of an earlier
+run and the script exits with status 1 if any run got slower or used more
+memory than `--threshold` times as much.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Number of tests per generated module
+TESTS_PER_MODULE = 10_000
+
+MODULE_TEMPLATE = '''\
+import logging
+
+import pytest
+
+logger = logging.getLogger("bench")
+
+
+@pytest.mark.parametrize("i", range({start}, {stop}))
+def test_case(i, json_metadata):
+    for j in range({log_records}):
+        logger.warning("log message %d of test %d", j, i)
+    if {stdout_size}:
+        print("x" * {stdout_size})
+    if {metadata_size}:
+        json_metadata["data"] = {{f"key{{j}}": [j, str(j)] for j in range({metadata_size})}}
+    # Spread the failures evenly over the suite
+    assert i * 7919 % 10000 >= {failure_limit}
+'''
+
+SCENARIOS = {
+    "baseline": [],
+    "report": ["--json-report", "--json-report-overhead"],
+    "summary": ["--json-report", "--json-report-summary", "--json-report-overhead"],
+    "xdist": ["--json-report", "--json-report-overhead", "-n", "{workers}"],
+}
+
+# Results which are compared with `--compare`
+COMPARED = ["wall_time", "peak_rss", "report_size", "write_time"]
+
+
+def make_suite(path, num_tests, failure_rate, log_records, stdout_size, metadata_size):
+    """Write a test suite with `num_tests` tests to the directory `path`."""
+    for start in range(0, num_tests, TESTS_PER_MODULE):
+        source = MODULE_TEMPLATE.format(
+            start=start,
+            stop=min(start + TESTS_PER_MODULE, num_tests),
+            log_records=log_records,
+            stdout_size=stdout_size,
+            metadata_size=metadata_size,
+            failure_limit=round(failure_rate * 10000),
+        )
+        (path / f"test_mod{start // TESTS_PER_MODULE}.py").write_text(source, encoding="utf-8")
+
+
+def run(path, args):
+    """Run pytest with `args` in `path` and return its results."""
+    report_path = path / ".report.json"
+    report_path.unlink(missing_ok=True)
+    cmd = [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", *args]
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=path, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # Unlike `RUSAGE_CHILDREN`, this gets the usage of this child only
+    _, status, rusage = os.wait4(proc.pid, 0)
+    wall_time = time.perf_counter() - start
+    # Let `proc` know that the process has been reaped
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    result = {
+        "exitcode": proc.returncode,
+        "wall_time": wall_time,
+        # In kilobytes on Linux, in bytes on macOS
+        "peak_rss": rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+    }
+    if report_path.exists():
+        with report_path.open(encoding="utf-8") as f:
+            overhead = json.load(f).get("plugin_overhead", {})
+        result["report_size"] = report_path.stat().st_size
+        result["write_time"] = overhead.get("serialization")
+        result["hooks_time"] = overhead.get("total")
+    return result
+
+
+def format_result(result):
+    line = (
+        f"{result['tests']:>9} tests  {result['scenario']:<8}  {result['wall_time']:8.2f}s  "
+        f"{result['peak_rss'] / 2**20:8.1f} MiB"
+    )
+    if result.get("write_time") is not None:
+        line += (
+            f"  report {result['report_size'] / 2**20:8.1f} MiB written in "
+            f"{result['write_time']:.2f}s"
+        )
+    return line
+
+
+def compare(results, baseline, threshold):
+    """Print the results that regressed compared to `baseline` and return whether any did."""
+    previous = {(r["tests"], r["scenario"]): r for r in baseline["results"]}
+    regressed = False
+    for result in results:
+        old = previous.get((result["tests"], result["scenario"]))
+        if old is None:
+            continue
+        for key in COMPARED:
+            new_value, old_value = result.get(key), old.get(key)
+            if new_value and old_value and new_value > threshold * old_value:
+                regressed = True
+                print(
+                    f"REGRESSION {result['scenario']} ({result['tests']} tests): "
+                    f"{key} {old_value:.4g} -> {new_value:.4g}"
+                )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--log-records", type=int, default=0, help="log records per test")
+    parser.add_argument("--stdout-size", type=int, default=0, help="bytes of stdout per test")
+    parser.add_argument("--metadata-size", type=int, default=0, help="metadata keys per test")
+    parser.add_argument("--workers", type=int, default=4, help="number of xdist workers")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--output", default="bench_scaling.json", help="file to write results to")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument(
+        "--threshold", type=float, default=1.1, help="ratio above which a result regressed"
+    )
+    args = parser.parse_args()
+
+    scenarios = args.scenarios
+    if "xdist" in scenarios and importlib.util.find_spec("xdist") is None:
+        print("pytest-xdist is not installed, skipping the xdist scenario")
+        scenarios = [s for s in scenarios if s != "xdist"]
+    suite_config = {
+        "failure_rate": args.failure_rate,
+        "log_records": args.log_records,
+        "stdout_size": args.stdout_size,
+        "metadata_size": args.metadata_size,
+    }
+    results = []
+    for num_tests in args.sizes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir)
+            make_suite(path, num_tests, **suite_config)
+            for scenario in scenarios:
+                pytest_args = [arg.format(workers=args.workers) for arg in SCENARIOS[scenario]]
+                result = {"tests": num_tests, "scenario": scenario, **run(path, pytest_args)}
+                results.append(result)
+                print(format_result(result))
+
+    config = {**suite_config, "workers": args.workers}
+    with Path(args.output).open("w", encoding="utf-8") as f:
+        json.dump({"python": sys.version, "config": config, "results": results}, f, indent=2)
+    if args.compare:
+        with Path(args.compare).open(encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"warning: the suites differ from those of {args.compare}")
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Generate synthetic reports for the benchmarks."""
+
+import random
+
+
+def make_test(i, failed=False, num_log_records=0, stdout_size=0, metadata_size=0):
+    """Return a test item as it appears in the `tests` list of a report."""
+    nodeid = f"tests/pkg{i % 100}/test_mod{i % 1000}.py::TestClass::test_func[param{i}]"
+    stage = {"duration": random.random() / 1000, "outcome": "passed"}
+    test = {
+        "nodeid": nodeid,
+        "lineno": i % 500,
+        "outcome": "passed",
+        "keywords": [f"test_func[param{i}]", "TestClass", f"test_mod{i % 1000}.py", "parametrize"],
+        "setup": dict(stage),
+        "call": dict(stage),
+        "teardown": dict(stage),
+    }
+    if failed:
+        path = f"tests/pkg{i % 100}/test_mod{i % 1000}.py"
+        test["outcome"] = test["call"]["outcome"] = "failed"
+        test["call"]["crash"] = {"path": path, "lineno": 42, "message": "AssertionError: assert 1 == 2"}
+        test["call"]["traceback"] = [
+            {"path": path, "lineno": 40, "message": ""},
+            {"path": "src/lib.py", "lineno": 10, "message": "AssertionError"},
+        ]
+        test["call"]["longrepr"] = "def test_func():\n>       assert 1 == 2\nE       assert 1 == 2\n" * 5
+    if num_log_records:
+        test["call"]["log"] = [
+            {
+                "name": "root",
+                "msg": f"log message {j}",
+                "args": None,
+                "levelname": "INFO",
+                "levelno": 20,
+                "pathname": "/path/to/lib.py",
+                "lineno": j,
+                "created": 1700000000.0 + j,
+            }
+            for j in range(num_log_records)
+        ]
+    if stdout_size:
+        test["call"]["stdout"] = "x" * stdout_size
+    if metadata_size:
+        test["metadata"] = {f"key{j}": [j, str(j), {"nested": j}] for j in range(metadata_size)}
+    return test
+
+
+def make_report(num_tests, failure_rate=0.1, **kwargs):
+    """Return a complete report with `num_tests` synthetic tests."""
+    rng = random.Random(0)
+    tests = [make_test(i, failed=rng.random() < failure_rate, **kwargs) for i in range(num_tests)]
+    return {
+        "created": 1700000000.0,
+        "duration": 123.4,
+        "exitcode": 1,
+        "root": "/path/to/root",
+        "environment": {"Python": "3.12.1", "Platform": "Linux"},
+        "summary": {"passed": num_tests, "total": num_tests, "collected": num_tests},
+        "tests": tests,
+    }
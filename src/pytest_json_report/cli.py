@@ -0,0 +1,174 @@
+"""Command line tools for reports, run with `python -m pytest_json_report`."""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from . import diff, encoders, journal, merge, writers
+from .index import ReportIndex
+
+
+def make_writer(args):
+    """Return a writer for the output options in `args`."""
+    encoder = encoders.get_encoder("auto")
+    if args.format == "jsonl":
+        return writers.JSONLinesWriter(args.output, encoder=encoder)
+    return writers.JSONWriter(args.output, indent=args.indent, encoder=encoder)
+
+
+def _add_output_arguments(parser):
+    parser.add_argument("-o", "--output", required=True, help="path of the report to write")
+    parser.add_argument(
+        "--format",
+        default="json",
+        choices=["json", "jsonl"],
+        help="format of the report to write (default: json)",
+    )
+    parser.add_argument("--indent", type=int, help="pretty-print JSON with this indentation level")
+
+
+def cmd_diff(args):
+    result = diff.diff_reports(
+        args.base,
+        args.head,
+        rel_threshold=args.rel_threshold,
+        abs_threshold=args.abs_threshold,
+        z_threshold=args.z_threshold,
+    )
+    if args.json:
+        output = json.dumps(result, indent=args.indent)
+    else:
+        output = "\n".join(diff.format_diff(result))
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+    summary = result["summary"]
+    if args.exit_code and (summary["new_failures"] or summary["duration_regressions"]):
+        return 1
+    return 0
+
+
+def cmd_merge(args):
+    merge.merge_reports(args.reports, make_writer(args), duplicates=args.duplicates)
+    return 0
+
+
+def cmd_recover(args):
+    session = journal.recover_journal(args.journal, make_writer(args))
+    if "in_flight" in session:
+        print(f"session was interrupted while running: {session['in_flight']}", file=sys.stderr)
+    return 0
+
+
+def cmd_show(args):
+    with ReportIndex(args.report) as index:
+        try:
+            test = index[args.nodeid]
+        except KeyError:
+            print(f"test not found: {args.nodeid}", file=sys.stderr)
+            return 1
+    print(json.dumps(test, indent=args.indent))
+    return 0
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m pytest_json_report", description="Tools for pytest JSON reports."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    merge_parser = subparsers.add_parser(
+        "merge",
+        help="merge several reports into one",
+        description="Merge several reports (standard or JSON Lines, possibly compressed) "
+        "into one. The summary is recomputed from the merged tests.",
+    )
+    merge_parser.add_argument("reports", nargs="+", help="paths of the reports to merge")
+    merge_parser.add_argument(
+        "--duplicates",
+        default="last",
+        choices=merge.DUPLICATE_POLICIES,
+        help="which occurrence of a test found in several reports to keep: the one from "
+        "the last or first report given, or the one with the worst outcome (default: last)",
+    )
+    _add_output_arguments(merge_parser)
+    merge_parser.set_defaults(func=cmd_merge)
+
+    recover_parser = subparsers.add_parser(
+        "recover",
+        help="turn a journal into a report",
+        description="Turn a journal written with --json-report-journal into a report. "
+        "If the session didn't finish, the report contains the tests finished so far and "
+        "its exit code is 2 (interrupted).",
+    )
+    recover_parser.add_argument("journal", help="path of the journal")
+    _add_output_arguments(recover_parser)
+    recover_parser.set_defaults(func=cmd_recover)
+
+    diff_parser = subparsers.add_parser(
+        "diff",
+        help="compare the tests of two reports",
+        description="Compare the tests of a report with those of a baseline: list new "
+        "failures, fixed tests, other outcome changes, added and removed tests and duration "
+        "regressions of passed tests. With several baseline reports, a duration must also be "
+        "significantly above their mean to count as a regression.",
+    )
+    diff_parser.add_argument("base", nargs="+", help="paths of the baseline reports")
+    diff_parser.add_argument("head", help="path of the report to compare")
+    diff_parser.add_argument(
+        "--rel-threshold",
+        type=float,
+        default=0.5,
+        help="relative increase of a duration above which it regressed (default: 0.5)",
+    )
+    diff_parser.add_argument(
+        "--abs-threshold",
+        type=float,
+        default=0.1,
+        help="increase of a duration in seconds above which it regressed (default: 0.1)",
+    )
+    diff_parser.add_argument(
+        "--z-threshold",
+        type=float,
+        default=3.0,
+        help="number of standard deviations above the mean of several baselines above which "
+        "a duration regressed (default: 3)",
+    )
+    diff_parser.add_argument("--json", action="store_true", help="output the differences as JSON")
+    diff_parser.add_argument(
+        "--indent", type=int, help="pretty-print JSON with this indentation level"
+    )
+    diff_parser.add_argument("-o", "--output", help="file to write the output to (default: stdout)")
+    diff_parser.add_argument(
+        "--exit-code",
+        action="store_true",
+        help="exit with status 1 if there are new failures or duration regressions",
+    )
+    diff_parser.set_defaults(func=cmd_diff)
+
+    show_parser = subparsers.add_parser(
+        "show",
+        help="show a single test of a report",
+        description="Show a single test of a report written with --json-report-index, "
+        "reading only that test from the report.",
+    )
+    show_parser.add_argument("nodeid", help="node ID of the test")
+    show_parser.add_argument(
+        "-r", "--report", default=".report.json", help="path of the report (default: .report.json)"
+    )
+    show_parser.add_argument(
+        "--indent", type=int, default=2, help="indentation level of the output (default: 2)"
+    )
+    show_parser.set_defaults(func=cmd_show)
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
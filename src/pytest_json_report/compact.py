@@ -0,0 +1,165 @@
+"""Compact report variant which stores repeated strings only once.
+
+In a compact report, the node ID parts (split at "::"), the keywords and the
+`path` of the crash and traceback entries of each test are replaced by
+indices into a table of distinct strings. In the standard JSON format, the
+table is the top-level `strings` list. In the JSON Lines format, every test
+record carries the strings it adds to the table in its `$strings` key, so the
+lines can be decoded one at a time.
+
+`expand_report()` and `expand_records()` turn a compact report back into the
+standard format.
+"""
+
+from .serialize import NON_STAGE_KEYS
+from .writers import RECORD_TYPE_KEY
+
+# Key of the strings added to the table by a JSON Lines record
+STRINGS_KEY = "$strings"
+
+
+class StringTable:
+    """Table of distinct strings which are referred to by their index."""
+
+    def __init__(self):
+        self.strings = []
+        self._indices = {}
+
+    def index(self, string):
+        try:
+            return self._indices[string]
+        except KeyError:
+            index = self._indices[string] = len(self.strings)
+            self.strings.append(string)
+            return index
+
+
+def compact_test(test, table):
+    """Return a copy of the test dict `test` with its strings replaced by indices."""
+    test = dict(test)
+    test["nodeid"] = [table.index(part) for part in test["nodeid"].split("::")]
+    if "keywords" in test:
+        test["keywords"] = [table.index(keyword) for keyword in test["keywords"]]
+    for key, stage in test.items():
+        if key not in NON_STAGE_KEYS and isinstance(stage, dict):
+            test[key] = _compact_stage(stage, table)
+    return test
+
+
+def _compact_stage(stage, table):
+    stage = dict(stage)
+    if isinstance(stage.get("crash"), dict):
+        stage["crash"] = _compact_fileloc(stage["crash"], table)
+    if isinstance(stage.get("traceback"), list):
+        stage["traceback"] = [_compact_fileloc(loc, table) for loc in stage["traceback"]]
+    return stage
+
+
+def _compact_fileloc(loc, table):
+    if not isinstance(loc.get("path"), str):
+        return loc
+    return {**loc, "path": table.index(loc["path"])}
+
+
+def expand_test(test, strings):
+    """Return the compact test dict `test` in the standard format.
+
+    `strings` is the string table the indices of `test` refer to.
+    """
+    test = dict(test)
+    test["nodeid"] = "::".join(strings[i] for i in test["nodeid"])
+    if "keywords" in test:
+        test["keywords"] = [strings[i] for i in test["keywords"]]
+    for key, stage in test.items():
+        if key not in NON_STAGE_KEYS and isinstance(stage, dict):
+            test[key] = _expand_stage(stage, strings)
+    return test
+
+
+def _expand_stage(stage, strings):
+    stage = dict(stage)
+    if isinstance(stage.get("crash"), dict):
+        stage["crash"] = _expand_fileloc(stage["crash"], strings)
+    if isinstance(stage.get("traceback"), list):
+        stage["traceback"] = [_expand_fileloc(loc, strings) for loc in stage["traceback"]]
+    return stage
+
+
+def _expand_fileloc(loc, strings):
+    if not isinstance(loc.get("path"), int):
+        return loc
+    return {**loc, "path": strings[loc["path"]]}
+
+
+def expand_report(report):
+    """Return the compact standard-format `report` dict in the standard format.
+
+    A report which isn't compact is returned unchanged.
+    """
+    if "strings" not in report:
+        return report
+    report = dict(report)
+    strings = report.pop("strings")
+    if "tests" in report:
+        report["tests"] = [expand_test(test, strings) for test in report["tests"]]
+    return report
+
+
+def expand_records(records):
+    """Yield the records of a compact JSON Lines report in the standard format.
+
+    `records` is an iterable of the decoded lines. Records which aren't
+    compact are yielded unchanged.
+    """
+    strings = []
+    for record in records:
+        if STRINGS_KEY in record:
+            record = dict(record)
+            strings.extend(record.pop(STRINGS_KEY))
+        if record.get(RECORD_TYPE_KEY) == "test" and isinstance(record.get("nodeid"), list):
+            record = expand_test(record, strings)
+        yield record
+
+
+class CompactWriter:
+    """Wrap a report writer to write a compact report.
+
+    With `incremental`, the strings added to the table by a test are written
+    along with it (for the JSON Lines format). Otherwise, the whole table is
+    written as the `strings` member when finishing the report.
+    """
+
+    def __init__(self, writer, incremental=False):
+        self._writer = writer
+        self._incremental = incremental
+        self._table = StringTable()
+        self._num_written_strings = 0
+
+    @property
+    def error(self):
+        return self._writer.error
+
+    @property
+    def bytes_written(self):
+        return self._writer.bytes_written
+
+    def start_tests(self):
+        self._writer.start_tests()
+
+    def write_test(self, test):
+        test = compact_test(test, self._table)
+        if self._incremental and self._num_written_strings < len(self._table.strings):
+            test[STRINGS_KEY] = self._table.strings[self._num_written_strings :]
+            self._num_written_strings = len(self._table.strings)
+        self._writer.write_test(test)
+
+    def write_member(self, key, value):
+        self._writer.write_member(key, value)
+
+    def finish(self):
+        if not self._incremental:
+            self._writer.write_member("strings", self._table.strings)
+        self._writer.finish()
+
+    def close(self):
+        self._writer.close()
@@ -0,0 +1,136 @@
+"""Compare the tests of two reports, e.g. of a pull request and its base branch.
+
+The baseline reports are read first, keeping only the outcome and duration
+of each test in a table by node ID. The head report is then read one test at
+a time (for JSON Lines reports) and each test is looked up in that table, so
+memory use only depends on the number of tests in the baselines.
+
+Failures are the `FAILING` outcomes. The outcome of a test in the baseline is
+its outcome in the last baseline report given, while its duration is compared
+to those in all baselines where it passed: with a single one, the head
+duration is a regression if it exceeds both the relative and the absolute
+threshold; with several, it must also be `z_threshold` standard deviations
+above their mean.
+"""
+
+import statistics
+
+from . import readers
+from .serialize import STAGES
+
+FAILING = frozenset(["failed", "error"])
+
+# Keys of the result with lists of tests, in the order they are printed
+CATEGORIES = (
+    "new_failures",
+    "fixed",
+    "outcome_changes",
+    "added",
+    "removed",
+    "duration_regressions",
+)
+
+
+def _test_duration(test):
+    """Return the sum of the stage durations of the test dict `test`."""
+    # A plain loop, as this is called for most tests
+    duration = 0.0
+    for when in STAGES:
+        stage = test.get(when)
+        if stage is not None:
+            duration += stage.get("duration", 0)
+    return duration
+
+
+def _read_baselines(paths):
+    """Return the outcome in the last baseline and the passed durations of each test."""
+    baseline = {}
+    for path in paths:
+        for test in readers.iter_tests(path):
+            outcome = test.get("outcome", "passed")
+            try:
+                entry = baseline[test["nodeid"]]
+            except KeyError:
+                entry = baseline[test["nodeid"]] = [outcome, []]
+            entry[0] = outcome
+            if outcome == "passed":
+                entry[1].append(_test_duration(test))
+    return baseline
+
+
+def _regression(durations, duration, rel_threshold, abs_threshold, z_threshold):
+    """Return the details of the duration regression, or None if there's none."""
+    mean = statistics.fmean(durations)
+    if duration <= mean * (1 + rel_threshold) or duration - mean <= abs_threshold:
+        return None
+    regression = {"base": mean, "head": duration}
+    if len(durations) > 1:
+        stdev = statistics.stdev(durations)
+        if duration <= mean + z_threshold * stdev:
+            return None
+        regression["stdev"] = stdev
+    return regression
+
+
+def diff_reports(base_paths, head_path, rel_threshold=0.5, abs_threshold=0.1, z_threshold=3.0):
+    """Return the differences between the tests of the reports at `base_paths` and `head_path`.
+
+    The result has a count per category in `summary` and a list of tests per
+    category (see `CATEGORIES`). The lists are in the order of the head
+    report, except for the removed tests, which are in the order of the
+    baseline, and the duration regressions, which are the largest first.
+    """
+    baseline = _read_baselines(base_paths)
+    result = {category: [] for category in CATEGORIES}
+    for test in readers.iter_tests(head_path):
+        nodeid = test["nodeid"]
+        outcome = test.get("outcome", "passed")
+        entry = baseline.pop(nodeid, None)
+        if entry is None:
+            result["added"].append({"nodeid": nodeid, "outcome": outcome})
+            if outcome in FAILING:
+                result["new_failures"].append({"nodeid": nodeid, "base": None, "head": outcome})
+            continue
+        base_outcome, durations = entry
+        change = {"nodeid": nodeid, "base": base_outcome, "head": outcome}
+        if outcome in FAILING and base_outcome not in FAILING:
+            result["new_failures"].append(change)
+        elif base_outcome in FAILING and outcome not in FAILING:
+            result["fixed"].append(change)
+        elif outcome != base_outcome:
+            result["outcome_changes"].append(change)
+        if outcome == "passed" and durations:
+            regression = _regression(
+                durations, _test_duration(test), rel_threshold, abs_threshold, z_threshold
+            )
+            if regression is not None:
+                result["duration_regressions"].append({"nodeid": nodeid, **regression})
+    result["removed"] = [
+        {"nodeid": nodeid, "outcome": outcome} for nodeid, (outcome, _) in baseline.items()
+    ]
+    result["duration_regressions"].sort(key=lambda r: r["head"] - r["base"], reverse=True)
+    return {"summary": {category: len(result[category]) for category in CATEGORIES}, **result}
+
+
+def format_diff(result):
+    """Return the lines of a human-readable description of the result of `diff_reports()`."""
+    lines = []
+    for category in CATEGORIES:
+        tests = result[category]
+        if not tests:
+            continue
+        lines.append(f"{category.replace('_', ' ')} ({len(tests)}):")
+        for test in tests:
+            if category in {"added", "removed"}:
+                details = test["outcome"]
+            elif category == "duration_regressions":
+                details = f"{test['base']:.3f}s -> {test['head']:.3f}s"
+            else:
+                details = f"{test['base'] or 'absent'} -> {test['head']}"
+            lines.append(f"  {test['nodeid']} ({details})")
+    lines.append(
+        ", ".join(
+            f"{count} {category.replace('_', ' ')}" for category, count in result["summary"].items()
+        )
+    )
+    return lines
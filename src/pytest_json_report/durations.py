@@ -0,0 +1,136 @@
+"""Duration statistics of the tests in the summary, see `--json-report-durations`.
+
+The durations of the tests and of their stages are counted in the buckets of
+`overhead.BUCKET_RATIO`, from which the percentiles are estimated, and in a
+histogram with a bin per power of ten. Only the slowest tests and stages are
+kept, in heaps of bounded size. All of these can be merged, so the
+statistics of merged reports (e.g. of xdist workers or CI shards) are the
+same as if all tests had run in one session.
+"""
+
+import heapq
+import math
+
+from .overhead import bucket, percentile
+
+QUANTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+
+
+def _new_stats():
+    return {"count": 0, "total": 0.0, "buckets": {}, "histogram": {}}
+
+
+def _add(stats, duration):
+    stats["count"] += 1
+    stats["total"] += duration
+    buckets = stats["buckets"]
+    index = bucket(duration)
+    buckets[index] = buckets.get(index, 0) + 1
+    # The bin of durations up to 10**exponent seconds
+    histogram = stats["histogram"]
+    exponent = math.ceil(math.log10(duration)) if duration > 0 else None
+    histogram[exponent] = histogram.get(exponent, 0) + 1
+
+
+def _push(heap, size, entry):
+    if size <= 0:
+        return
+    if len(heap) < size:
+        heapq.heappush(heap, entry)
+    elif entry > heap[0]:
+        heapq.heapreplace(heap, entry)
+
+
+class DurationStats:
+    """Statistics of the durations of tests and their stages.
+
+    Stages are added as they are reported, and the duration of a test is the
+    sum of its stages, which is added after its teardown stage (or when the
+    statistics are returned, for tests that didn't get that far).
+    """
+
+    def __init__(self, top=10):
+        self.top = top
+        self._tests = _new_stats()
+        self._stages = {}
+        # Min-heaps of (duration, nodeid) and (duration, nodeid, when)
+        self._slowest_tests = []
+        self._slowest_stages = []
+        # Sum of the stage durations of each running test
+        self._running = {}
+
+    def add_stage(self, nodeid, when, duration):
+        """Add the stage `when` of test `nodeid`, which took `duration` seconds."""
+        try:
+            stats = self._stages[when]
+        except KeyError:
+            stats = self._stages[when] = _new_stats()
+        _add(stats, duration)
+        _push(self._slowest_stages, self.top, (duration, nodeid, when))
+        self._running[nodeid] = self._running.get(nodeid, 0.0) + duration
+        if when == "teardown":
+            self._finish_test(nodeid)
+
+    def _finish_test(self, nodeid):
+        duration = self._running.pop(nodeid)
+        _add(self._tests, duration)
+        _push(self._slowest_tests, self.top, (duration, nodeid))
+
+    def merge(self, durations):
+        """Add the statistics `durations` of another report, see `to_dict()`."""
+        _merge_stats(self._tests, durations["tests"])
+        for when, other in durations["stages"].items():
+            _merge_stats(self._stages.setdefault(when, _new_stats()), other)
+        for test in durations["slowest_tests"]:
+            _push(self._slowest_tests, self.top, (test["duration"], test["nodeid"]))
+        for stage in durations["slowest_stages"]:
+            _push(
+                self._slowest_stages,
+                self.top,
+                (stage["duration"], stage["nodeid"], stage["when"]),
+            )
+
+    def to_dict(self):
+        """Return the `durations` entry of the summary."""
+        for nodeid in list(self._running):
+            self._finish_test(nodeid)
+        return {
+            "tests": _stats_to_dict(self._tests),
+            "stages": {when: _stats_to_dict(stats) for when, stats in self._stages.items()},
+            "slowest_tests": [
+                {"nodeid": nodeid, "duration": duration}
+                for duration, nodeid in sorted(self._slowest_tests, reverse=True)
+            ],
+            "slowest_stages": [
+                {"nodeid": nodeid, "when": when, "duration": duration}
+                for duration, nodeid, when in sorted(self._slowest_stages, reverse=True)
+            ],
+        }
+
+
+def _merge_stats(stats, other):
+    """Add the statistics `other` as returned by `_stats_to_dict()` to `stats`."""
+    stats["count"] += other["count"]
+    stats["total"] += other["total"]
+    buckets = stats["buckets"]
+    for index, count in other["sketch"].items():
+        buckets[int(index)] = buckets.get(int(index), 0) + count
+    histogram = stats["histogram"]
+    for bin_ in other["histogram"]:
+        exponent = None if bin_["le"] == 0 else round(math.log10(bin_["le"]))
+        histogram[exponent] = histogram.get(exponent, 0) + bin_["count"]
+
+
+def _stats_to_dict(stats):
+    count = stats["count"]
+    return {
+        "count": count,
+        "total": stats["total"],
+        **{key: percentile(stats["buckets"], count, q) for key, q in QUANTILES.items()},
+        "histogram": [
+            {"le": 0 if exponent is None else 10.0**exponent, "count": stats["histogram"][exponent]}
+            for exponent in sorted(stats["histogram"], key=lambda e: -math.inf if e is None else e)
+        ],
+        # JSON only has string keys
+        "sketch": {str(index): count for index, count in sorted(stats["buckets"].items())},
+    }
@@ -0,0 +1,82 @@
+"""JSON encoders that can be used to write the report.
+
+Encoders other than the stdlib one use optional third-party packages. All of
+them turn values that aren't JSON-serializable into strings, like
+`json.dumps(..., default=str)` does.
+"""
+
+import json
+
+
+class StdlibEncoder:
+    name = "stdlib"
+
+    @staticmethod
+    def dumps(obj, indent=None):
+        return json.dumps(obj, default=str, indent=indent)
+
+
+class OrjsonEncoder:
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+        self._options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, indent=None):
+        # orjson can only indent with two spaces
+        if indent not in {None, 2}:
+            return StdlibEncoder.dumps(obj, indent)
+        options = self._options if indent is None else self._options | self._orjson.OPT_INDENT_2
+        try:
+            return self._orjson.dumps(obj, default=str, option=options).decode()
+        # E.g. integers exceeding 64 bits, which the stdlib can handle
+        except TypeError:
+            return StdlibEncoder.dumps(obj, indent)
+
+
+class MsgspecEncoder:
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+
+        self._msgspec = msgspec
+        self._encoder = msgspec.json.Encoder(enc_hook=str)
+
+    def dumps(self, obj, indent=None):
+        try:
+            data = self._encoder.encode(obj)
+        # E.g. dict keys of unsupported types, which the stdlib converts
+        except (TypeError, self._msgspec.EncodeError):
+            return StdlibEncoder.dumps(obj, indent)
+        if indent is not None:
+            data = self._msgspec.json.format(data, indent=indent)
+        return data.decode()
+
+
+ENCODERS = {
+    "stdlib": StdlibEncoder,
+    "orjson": OrjsonEncoder,
+    "msgspec": MsgspecEncoder,
+}
+
+# Encoders tried in this order when the encoder is "auto"
+_PREFERRED_ENCODERS = ["orjson", "msgspec", "stdlib"]
+
+
+def get_encoder(name):
+    """Return an instance of the encoder `name`.
+
+    If `name` is "auto", return the fastest encoder that is installed. Raise
+    `ImportError` if the package needed by the encoder is not installed.
+    """
+    if name == "auto":
+        for name_ in _PREFERRED_ENCODERS:
+            try:
+                return ENCODERS[name_]()
+            except ImportError:
+                continue
+    return ENCODERS[name]()
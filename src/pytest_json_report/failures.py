@@ -0,0 +1,182 @@
+"""Fingerprints of test failures and a table of the unique ones, see `--json-report-failures`.
+
+A failure's fingerprint is a hash of its crash location, the exception type
+and the frames of its traceback, but not of the exception message, which
+often contains values that vary from test to test. Tests that fail in the
+same way, e.g. because of a broken fixture they share, get the same
+fingerprint. The paths are normalized (see `normalize_path()`), so the
+fingerprint doesn't depend on the directory pytest was invoked from or on
+where packages are installed.
+
+The traceback of a failed stage is stored once per fingerprint in the
+`failures` table, along with the crash and longrepr of the first failure
+seen. The stage refers to its entry by `failure` and only keeps its own
+`crash` and `longrepr` if they differ from those of the entry, so no
+information is lost.
+"""
+
+import hashlib
+import json
+import re
+from pathlib import PurePath
+
+from .serialize import STAGES
+
+# Crash messages of exceptions start with their type, e.g. "ValueError: ..."
+_EXCEPTION_TYPE = re.compile(r"([A-Za-z_][\w.]*)(?::|$)")
+
+# Directories of installed packages, whose location varies between machines
+_PACKAGE_DIRS = frozenset(["site-packages", "dist-packages"])
+
+
+def _exception_type(stage):
+    traceback = stage.get("traceback")
+    if traceback:
+        # The message of the last entry is the exception type
+        return traceback[-1].get("message")
+    match = _EXCEPTION_TYPE.match(stage["crash"].get("message", ""))
+    return match.group(1) if match else None
+
+
+def normalize_path(path, root=None, invocation_dir=None):
+    """Return the path `path` of a crash or traceback entry in a portable form.
+
+    Paths of installed packages are reduced to the path inside the package
+    directory, e.g. "requests/api.py". Other paths are resolved against
+    `invocation_dir` (default `root`), as pytest writes them relative to the
+    current directory, and made relative to `root`. The result uses forward
+    slashes on all platforms.
+    """
+    if not path or path.startswith("<"):
+        # Empty or not a file, e.g. "<string>"
+        return path
+    parts = PurePath(path).parts
+    for i in range(len(parts) - 1, -1, -1):
+        if parts[i] in _PACKAGE_DIRS:
+            return PurePath(*parts[i + 1 :]).as_posix()
+    if root is None:
+        return path
+    # An absolute `path` replaces the directory it's joined to
+    absolute = _collapse(PurePath(invocation_dir or root, path))
+    try:
+        return absolute.relative_to(root, walk_up=True).as_posix()
+    except ValueError:
+        # On another drive than the root on Windows
+        return path
+
+
+def _collapse(path):
+    """Return the absolute path `path` without ".." entries, like `os.path.normpath()`."""
+    parts = []
+    for part in path.parts:
+        # The first part is the root (and drive), which ".." can't go above
+        if part == ".." and len(parts) > 1:
+            parts.pop()
+        elif part != "..":
+            parts.append(part)
+    return PurePath(*parts)
+
+
+def fingerprint(stage, root=None, invocation_dir=None):
+    """Return the fingerprint of the failed test stage dict `stage`.
+
+    `root` and `invocation_dir` are as for `normalize_path()`.
+    """
+    crash = stage["crash"]
+    path = normalize_path(crash.get("path"), root, invocation_dir)
+    frames = [
+        [
+            normalize_path(entry.get("path"), root, invocation_dir),
+            entry.get("lineno"),
+            entry.get("message"),
+        ]
+        for entry in stage.get("traceback", [])
+    ]
+    key = json.dumps([path, crash.get("lineno"), _exception_type(stage), frames])
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class FailureTable:
+    """The unique failures of the tests by fingerprint.
+
+    `root` is the root directory of the session, relative to which the paths
+    are compared, and `invocation_dir` the directory pytest was invoked from,
+    against which relative paths are resolved (see `normalize_path()`).
+    """
+
+    def __init__(self, root=None, invocation_dir=None):
+        self._root = root
+        self._invocation_dir = invocation_dir
+        self._entries = {}
+
+    def add_stage(self, stage, root=None):
+        """Count the failure of the stage dict `stage` and return its deduplicated copy.
+
+        Stages which didn't fail are returned unchanged. `root` overrides the
+        root directory of the table, e.g. for tests of several reports, and
+        relative paths are then resolved against it, as reports don't record
+        the directory pytest was invoked from.
+        """
+        if stage.get("outcome") != "failed" or "crash" not in stage:
+            return stage
+        # Stages restored by `expand_test()` keep their fingerprint
+        key = stage.get("failure")
+        if key is None:
+            if root is None:
+                key = fingerprint(stage, self._root, self._invocation_dir)
+            else:
+                key = fingerprint(stage, root)
+        try:
+            entry = self._entries[key]
+        except KeyError:
+            entry = self._entries[key] = {"fingerprint": key, "count": 0, "crash": stage["crash"]}
+            if "traceback" in stage:
+                entry["traceback"] = stage["traceback"]
+            if "longrepr" in stage:
+                entry["longrepr"] = stage["longrepr"]
+        entry["count"] += 1
+        stage = {name: val for name, val in stage.items() if name != "traceback"}
+        stage["failure"] = key
+        for name in ("crash", "longrepr"):
+            if name in stage and stage[name] == entry.get(name):
+                del stage[name]
+        return stage
+
+    def add_test(self, test, root=None):
+        """Return a copy of the test dict `test` with its failed stages deduplicated."""
+        copy = None
+        for when in STAGES:
+            stage = test.get(when)
+            if stage is None:
+                continue
+            deduplicated = self.add_stage(stage, root)
+            if deduplicated is not stage:
+                if copy is None:
+                    copy = dict(test)
+                copy[when] = deduplicated
+        return test if copy is None else copy
+
+    def counts(self):
+        """Return the number of failures by fingerprint, most frequent first."""
+        return {entry["fingerprint"]: entry["count"] for entry in self.to_list()}
+
+    def to_list(self):
+        """Return the `failures` entry of the report, most frequent first."""
+        return sorted(self._entries.values(), key=lambda entry: entry["count"], reverse=True)
+
+
+def expand_test(test, entries):
+    """Return a copy of the test dict `test` with the details of its failures restored.
+
+    `entries` maps the fingerprints to the entries of the failures table of
+    the report `test` is from.
+    """
+    copy = dict(test)
+    for when in STAGES:
+        stage = test.get(when)
+        if stage is None or "failure" not in stage:
+            continue
+        entry = entries.get(stage["failure"], {})
+        details = {key: entry[key] for key in ("crash", "traceback", "longrepr") if key in entry}
+        copy[when] = {**details, **stage}
+    return copy
@@ -0,0 +1,109 @@
+"""Index of the byte ranges of the tests in a report, to read single tests quickly.
+
+The index is a sidecar file next to the report (see `index_path()`). It's a
+hash table with open addressing, which is memory-mapped when reading, so
+looking up a test doesn't depend on the size of the report or the number of
+tests. The file consists of a header (`_HEADER`) followed by the slots
+(`_SLOT`), each holding a 64-bit hash of a node ID and the offset and length
+of the test in the report. Empty slots have a length of 0.
+"""
+
+import hashlib
+import json
+import mmap
+import struct
+from pathlib import Path
+
+from . import writers
+
+MAGIC = b"PJRIDX1\0"
+# Magic, number of slots, number of tests
+_HEADER = struct.Struct("<8sQQ")
+# Hash of the node ID, offset and length of the test
+_SLOT = struct.Struct("<QQQ")
+
+
+def index_path(report_path):
+    """Return the path of the index of the report at `report_path`."""
+    return Path(f"{report_path}.idx")
+
+
+def _hash(nodeid):
+    return int.from_bytes(hashlib.blake2b(nodeid.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class IndexBuilder:
+    """Collect the byte ranges of the tests while a report is written."""
+
+    def __init__(self):
+        self._entries = []
+
+    def add(self, nodeid, offset, length):
+        self._entries.append((_hash(nodeid), offset, length))
+
+    def write(self, path):
+        """Write the index to `path`."""
+        # Keep the table at most half full, so probing stays short
+        num_slots = max(1, 2 * len(self._entries))
+        table = bytearray(num_slots * _SLOT.size)
+        for hash_, offset, length in self._entries:
+            slot = hash_ % num_slots
+            while _SLOT.unpack_from(table, slot * _SLOT.size)[2]:
+                slot = (slot + 1) % num_slots
+            _SLOT.pack_into(table, slot * _SLOT.size, hash_, offset, length)
+        with Path(path).open("wb") as f:
+            f.write(_HEADER.pack(MAGIC, num_slots, len(self._entries)))
+            f.write(table)
+
+
+class ReportIndex:
+    """Read single tests from the uncompressed report at `report_path` using its index.
+
+    Use as a context manager or call `close()` when done.
+    """
+
+    def __init__(self, report_path):
+        with index_path(report_path).open("rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self._num_slots, self.num_tests = _HEADER.unpack_from(self._index)
+            if magic != MAGIC:
+                msg = f"not a report index: {index_path(report_path)}"
+                raise ValueError(msg)
+            with Path(report_path).open("rb") as f:
+                # An empty file can't be mapped, but it has no tests anyway
+                self._report = (
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.num_tests else b""
+                )
+        except BaseException:
+            self._index.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._index.close()
+        if isinstance(self._report, mmap.mmap):
+            self._report.close()
+
+    def __getitem__(self, nodeid):
+        """Return the test dict of `nodeid`, or raise `KeyError` if it isn't in the report."""
+        hash_ = _hash(nodeid)
+        slot = hash_ % self._num_slots
+        while True:
+            slot_hash, offset, length = _SLOT.unpack_from(
+                self._index, _HEADER.size + slot * _SLOT.size
+            )
+            if not length:
+                raise KeyError(nodeid)
+            if slot_hash == hash_:
+                test = json.loads(self._report[offset : offset + length])
+                # Different node IDs can have the same hash
+                if test.get("nodeid") == nodeid:
+                    test.pop(writers.RECORD_TYPE_KEY, None)
+                    return test
+            slot = (slot + 1) % self._num_slots
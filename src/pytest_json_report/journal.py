@@ -0,0 +1,81 @@
+"""Recover a report from the journal of a session, see `writers.JournalWriter`."""
+
+import json
+from collections import Counter
+
+import pytest
+
+from . import readers, serialize
+from .writers import RECORD_TYPE_KEY
+
+
+def _read_records(path):
+    """Yield the records of the journal at `path`, skipping incomplete lines.
+
+    A compressed journal which was cut off when the session was killed ends
+    at the last record that was flushed.
+    """
+    with readers.open_report(path) as f:
+        while True:
+            try:
+                line = f.readline()
+            except EOFError:
+                # The end of the compressed stream is missing
+                break
+            if not line:
+                break
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def recover_journal(path, writer):
+    """Write the report recorded in the journal at `path` with `writer`.
+
+    If the session didn't finish, the session keys are reconstructed from the
+    journal: `exitcode` is "interrupted" (2), the summary counts the finished
+    tests and `in_flight` is the node ID of the test which started last of
+    those that were running (if any). Return the session keys written.
+    """
+    info = {}
+    collected = None
+    session = None
+    # Tests which have started but not finished (several with xdist)
+    running = {}
+    last_time = None
+    counts = Counter()
+    writer.start_tests()
+    for record in _read_records(path):
+        record_type = record.pop(RECORD_TYPE_KEY, None)
+        if record_type == "journal":
+            info = record
+        elif record_type == "collection":
+            collected = record.get("collected")
+        elif record_type == "start":
+            running[record["nodeid"]] = True
+            last_time = record.get("time")
+        elif record_type == "test":
+            writer.write_test(record)
+            counts[record.get("outcome")] += 1
+            running.pop(record["nodeid"], None)
+        elif record_type == "session":
+            session = record
+    if session is None:
+        created = info.get("created")
+        session = serialize.make_report(
+            created=created,
+            duration=last_time - created if last_time and created else 0,
+            exitcode=int(pytest.ExitCode.INTERRUPTED),
+            root=info.get("root"),
+            environment=info.get("environment", {}),
+            summary=serialize.make_summary(
+                {}, counts=counts, **({} if collected is None else {"collected": collected})
+            ),
+        )
+        if running:
+            session["in_flight"] = list(running)[-1]
+    for key, val in session.items():
+        writer.write_member(key, val)
+    writer.finish()
+    return session
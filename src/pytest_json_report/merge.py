@@ -0,0 +1,275 @@
+"""Merge several reports, e.g. of a test suite split across CI machines, into one.
+
+The inputs are read twice, one at a time: first to decide which occurrence
+of each test is kept and to merge the session keys as they're read, then
+to write the kept tests. Memory use depends on the number of distinct tests,
+collectors and failures and on the size of the largest input, but not on the
+number of inputs. JSON Lines inputs are read one test at a time.
+
+If a test occurs more than once, the occurrence to keep is chosen by one of
+the `DUPLICATE_POLICIES`:
+
+- `last`: the occurrence from the input given last, e.g. a rerun (default)
+- `first`: the occurrence from the input given first
+- `worst`: the occurrence with the worst outcome (see `OUTCOME_SEVERITY`),
+  or the last one among those
+"""
+
+from collections import Counter
+
+import pytest
+
+from . import failures, readers, serialize
+from .durations import DurationStats
+from .writers import RECORD_TYPE_KEY
+
+DUPLICATE_POLICIES = ("last", "first", "worst")
+
+# Outcomes from best to worst, used by the "worst" duplicate policy
+OUTCOME_SEVERITY = {
+    outcome: i
+    for i, outcome in enumerate(["passed", "skipped", "xfailed", "xpassed", "failed", "error"])
+}
+
+
+def merge_reports(paths, writer, duplicates="last"):
+    """Merge the reports at `paths` and write the result with `writer`.
+
+    If any report has a failures table (see `--json-report-failures`), the
+    failures of the kept tests are deduplicated into a new one.
+    """
+    session, kept, inputs = _merge_sessions(paths, duplicates)
+    failure_table = (
+        failures.FailureTable() if any(entries is not None for _, entries in inputs) else None
+    )
+    writer.start_tests()
+    for i, path in enumerate(paths):
+        root, entries = inputs[i]
+        for j, record in enumerate(readers.iter_tests(path)):
+            if kept[record["nodeid"]][0] != (i, j):
+                continue
+            if failure_table is not None:
+                record = failure_table.add_test(
+                    failures.expand_test(record, entries or {}), root=root
+                )
+            writer.write_test(record)
+    if failure_table is not None:
+        session["summary"]["failures"] = failure_table.counts()
+        session["failures"] = failure_table.to_list()
+    for key, val in session.items():
+        writer.write_member(key, val)
+    writer.finish()
+
+
+def _merge_sessions(paths, duplicates):
+    """Return the merged session keys of the reports, the tests to keep and the inputs.
+
+    The tests to keep map each node ID to the position of the kept occurrence
+    (the index of the input and of the test in it) and its outcome. The
+    inputs are the `root` of each report and its failure entries by
+    fingerprint (None if it has no failures table). The rest of each report's
+    session keys is merged as it's read.
+    """
+    if duplicates not in DUPLICATE_POLICIES:
+        msg = f"invalid duplicate policy: {duplicates!r}"
+        raise ValueError(msg)
+    kept = {}
+    merged = _MergedSession()
+    inputs = []
+    for i, path in enumerate(paths):
+        j = 0
+        inputs.append((None, None))
+        for record in readers.iter_records(path):
+            record_type = record.pop(RECORD_TYPE_KEY, None)
+            if record_type == "session":
+                merged.add(record)
+                entries = None
+                if "failures" in record:
+                    entries = {entry["fingerprint"]: entry for entry in record["failures"]}
+                inputs[i] = (record.get("root"), entries)
+            if record_type != "test":
+                continue
+            nodeid = record["nodeid"]
+            outcome = record.get("outcome", "passed")
+            previous = kept.get(nodeid)
+            if previous is None or _replaces(outcome, previous[1], duplicates):
+                kept[nodeid] = ((i, j), outcome)
+            j += 1
+    session = merged.to_dict()
+    session["summary"] = merged.make_summary(Counter(outcome for _, outcome in kept.values()))
+    return session, kept, inputs
+
+
+def _replaces(outcome, previous_outcome, duplicates):
+    """Return whether a later occurrence of a test replaces an earlier one."""
+    if duplicates == "first":
+        return False
+    if duplicates == "worst":
+        return OUTCOME_SEVERITY.get(outcome, 0) >= OUTCOME_SEVERITY.get(previous_outcome, 0)
+    return True
+
+
+class _MergedSession:
+    """The session keys of the reports, merged one report at a time.
+
+    `created` is the latest creation time and `duration` the sum of the
+    durations. `root` and `environment` are taken from the first report.
+    Collectors with the same node ID are merged: their results contain the
+    items of all reports, and an item is only deselected if it's deselected
+    in every report which has it. Identical warnings are only kept once. The
+    fixture tables and the duration statistics are summed up. Only what's
+    distinct across the reports is held, so memory use doesn't grow with the
+    number of reports.
+    """
+
+    # Keys which are merged rather than taken from the first report
+    MERGED_KEYS = frozenset([
+        "summary",
+        "created",
+        "duration",
+        "exitcode",
+        "collectors",
+        "warnings",
+        "fixtures",
+        "failures",
+    ])
+
+    def __init__(self):
+        self._num_sessions = 0
+        self._created = 0
+        self._duration = 0
+        self._exitcodes = set()
+        # The collectors by node ID, each with its results by node ID
+        self._collectors = {}
+        # Whether the collectors of every report account for its collected tests
+        self._complete_collectors = True
+        self._warnings = {}
+        self._fixtures = {}
+        self._other_keys = {}
+        self._collected = 0
+        self._deselected = 0
+        self._durations = None
+
+    def add(self, session):
+        """Merge the session record `session` of a report."""
+        self._num_sessions += 1
+        self._created = max(self._created, session.get("created", 0))
+        self._duration += session.get("duration", 0)
+        self._exitcodes.add(session.get("exitcode", 0))
+        collectors = session.get("collectors", [])
+        summary = session.get("summary", {})
+        if _count_items(collectors)[0] != summary.get("collected", 0):
+            self._complete_collectors = False
+        for collector in collectors:
+            self._add_collector(collector)
+        for warning in session.get("warnings", []):
+            self._warnings.setdefault(tuple(sorted(warning.items())), warning)
+        for entry in session.get("fixtures", []):
+            serialize.add_fixture_stats(
+                self._fixtures, **{key: val for key, val in entry.items() if key != "total"}
+            )
+        for key, val in session.items():
+            if key not in self.MERGED_KEYS:
+                self._other_keys.setdefault(key, val)
+        self._collected += summary.get("collected", 0)
+        self._deselected += summary.get("deselected", 0)
+        if "durations" in summary:
+            self._add_durations(summary["durations"])
+
+    def _add_collector(self, collector):
+        try:
+            _, results = self._collectors[collector["nodeid"]]
+        except KeyError:
+            results = {item["nodeid"]: item for item in collector.get("result", [])}
+            self._collectors[collector["nodeid"]] = (collector, results)
+            return
+        for item in collector.get("result", []):
+            previous = results.setdefault(item["nodeid"], item)
+            # The item ran in at least one report
+            if previous.get("deselected") and not item.get("deselected"):
+                results[item["nodeid"]] = item
+
+    def _add_durations(self, durations):
+        top = len(durations["slowest_tests"])
+        if self._durations is None:
+            self._durations = DurationStats(top=top)
+        # The largest number of slowest tests of any report
+        self._durations.top = max(self._durations.top, top)
+        self._durations.merge(durations)
+
+    def to_dict(self):
+        """Return the merged session keys except for the summary."""
+        merged = {}
+        if not self._num_sessions:
+            return merged
+        merged["created"] = self._created
+        merged["duration"] = self._duration
+        merged["exitcode"] = _merge_exitcodes(list(self._exitcodes))
+        for key in ("root", "environment"):
+            if key in self._other_keys:
+                merged[key] = self._other_keys[key]
+        if self._collectors:
+            merged["collectors"] = [
+                {**collector, "result": list(results.values())}
+                if "result" in collector
+                else collector
+                for collector, results in self._collectors.values()
+            ]
+        if self._warnings:
+            merged["warnings"] = list(self._warnings.values())
+        if self._fixtures:
+            merged["fixtures"] = serialize.make_fixtures(self._fixtures)
+        for key, val in self._other_keys.items():
+            merged.setdefault(key, val)
+        return merged
+
+    def make_summary(self, counts):
+        """Return the summary of the merged report, see `serialize.make_summary()`.
+
+        The outcome counts are `counts`, those of the kept tests. If the
+        collectors of every report account for all of its collected tests,
+        the collected and deselected tests are counted by distinct node ID
+        over the merged collectors, so that shards of one test suite selected
+        with `-k` or `-m` count each test once. Otherwise (e.g. for reports of
+        xdist runs, which only have failed collectors, or without collectors),
+        their numbers are summed up. The duration statistics are those of all
+        tests, including duplicates which weren't kept.
+        """
+        if self._complete_collectors:
+            collected, deselected = _count_items([
+                {"nodeid": collector["nodeid"], "result": results.values()}
+                for collector, results in self._collectors.values()
+            ])
+        else:
+            collected, deselected = self._collected, self._deselected
+        kwargs = {"collected": collected}
+        if deselected:
+            kwargs["deselected"] = deselected
+        if self._durations is not None:
+            kwargs["durations"] = self._durations.to_dict()
+        return serialize.make_summary({}, counts=counts, **kwargs)
+
+
+def _count_items(collectors):
+    """Return the numbers of collected and deselected tests in the results of `collectors`."""
+    nodeids = {collector["nodeid"] for collector in collectors}
+    collected = deselected = 0
+    for collector in collectors:
+        for item in collector.get("result", []):
+            # Results which are collectors themselves aren't tests
+            if item["nodeid"] not in nodeids:
+                collected += 1
+                deselected += bool(item.get("deselected"))
+    return collected, deselected
+
+
+def _merge_exitcodes(exitcodes):
+    """Return the exit code of the merged session.
+
+    "No tests collected" only counts if no report has tests, otherwise the
+    highest exit code wins, e.g. "tests failed" over "OK".
+    """
+    exitcodes = [
+        code for code in exitcodes if code != pytest.ExitCode.NO_TESTS_COLLECTED
+    ] or exitcodes
+    return max(exitcodes)
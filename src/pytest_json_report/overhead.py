@@ -0,0 +1,126 @@
+"""Measure the time taken by the plugin itself, see `--json-report-overhead`.
+
+The durations of each part of the plugin are counted in buckets whose bounds
+grow by `BUCKET_RATIO`, so the percentiles are estimated within a few percent
+while the memory used doesn't grow with the number of tests. The timings of
+xdist workers are sent to the controller and merged there.
+"""
+
+import math
+import time
+
+# Ratio between the bounds of consecutive buckets
+BUCKET_RATIO = 2 ** (1 / 16)
+_LOG_RATIO = math.log(BUCKET_RATIO)
+# Durations are at least a nanosecond, as the log of 0 is undefined
+_MIN_DURATION = 1e-9
+
+
+class _Timer:
+    __slots__ = ("_name", "_overhead", "_start")
+
+    def __init__(self, overhead, name):
+        self._overhead = overhead
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self._overhead.add(self._name, time.perf_counter() - self._start)
+
+
+class Overhead:
+    """Timings of the parts of the plugin by name.
+
+    `state` maps each name to the number of calls, the total duration, the
+    number of records and bytes produced and the bucketed durations. It only
+    holds types that xdist can send from the workers to the controller.
+    """
+
+    def __init__(self):
+        self.state = {}
+
+    def measure(self, name):
+        """Return a context manager which adds the time spent in it to `name`."""
+        return _Timer(self, name)
+
+    def add(self, name, duration, records=0, num_bytes=0):
+        """Add a call of `name` which took `duration` seconds.
+
+        The call produced `records` records taking up `num_bytes` bytes.
+        """
+        timing = self._timing(name)
+        timing["count"] += 1
+        timing["total"] += duration
+        timing["records"] += records
+        timing["bytes"] += num_bytes
+        buckets = timing["buckets"]
+        index = bucket(duration)
+        buckets[index] = buckets.get(index, 0) + 1
+
+    def count(self, name, records=0, num_bytes=0):
+        """Add `records` and `num_bytes` produced by `name` without adding a call.
+
+        This is for output which is only counted after the call was measured,
+        so that counting doesn't add to its duration.
+        """
+        timing = self._timing(name)
+        timing["records"] += records
+        timing["bytes"] += num_bytes
+
+    def merge(self, state):
+        """Add the timings of another `Overhead`'s `state`, e.g. of an xdist worker."""
+        for name, other in state.items():
+            timing = self._timing(name)
+            for key in ("count", "total", "records", "bytes"):
+                timing[key] += other[key]
+            for bucket, count in other["buckets"].items():
+                timing["buckets"][bucket] = timing["buckets"].get(bucket, 0) + count
+
+    def to_dict(self):
+        """Return the `plugin_overhead` section of the report (without `serialization`)."""
+        return {
+            "total": sum(timing["total"] for timing in self.state.values()),
+            "hooks": {
+                name: {
+                    "count": timing["count"],
+                    "total": timing["total"],
+                    "p50": percentile(timing["buckets"], timing["count"], 0.5),
+                    "p99": percentile(timing["buckets"], timing["count"], 0.99),
+                    "records": timing["records"],
+                    "bytes": timing["bytes"],
+                }
+                for name, timing in self.state.items()
+            },
+        }
+
+    def _timing(self, name):
+        try:
+            return self.state[name]
+        except KeyError:
+            timing = self.state[name] = {
+                "count": 0,
+                "total": 0.0,
+                "records": 0,
+                "bytes": 0,
+                "buckets": {},
+            }
+            return timing
+
+
+def bucket(duration):
+    """Return the index of the bucket which `duration` is counted in."""
+    return math.floor(math.log(max(duration, _MIN_DURATION)) / _LOG_RATIO)
+
+
+def percentile(buckets, count, q):
+    """Return the estimated `q` quantile (0 < q <= 1) of `count` bucketed durations."""
+    rank = max(1, math.ceil(q * count))
+    seen = 0
+    for bucket in sorted(buckets):
+        seen += buckets[bucket]
+        if seen >= rank:
+            # The geometric middle of the bucket
+            return BUCKET_RATIO ** (bucket + 0.5)
+    return None
@@ -1,17 +1,37 @@
 # ruff: noqa: SLF001, PLR6301
-import errno
+import argparse
+import heapq
 import json
 import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
 import time
+import tracemalloc
 import warnings
-from collections import OrderedDict
-from contextlib import contextmanager, suppress
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager, nullcontext, suppress
+from functools import partial
 from pathlib import Path
 
 import _pytest.hookspec
 import pytest
 
-from . import serialize
+from . import compact, encoders, serialize, writers
+from .durations import DurationStats
+from .failures import FailureTable
+from .overhead import Overhead
+from .sqlite import SQLiteSink
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# `ru_maxrss` is in bytes on macOS and in kilobytes elsewhere
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
 
 
 class JSONReportError(Exception): ...
@@ -21,6 +41,25 @@ class JSONReportBase:
     def __init__(self, config=None):
         self._config = config
         self._logger = logging.getLogger()
+        # Results of `pytest_json_item_metadata` by module path (or None for
+        # the session) if they are memoized
+        self._item_metadata_cache = {}
+        # Timings of the plugin itself, if measured
+        self._overhead = None
+        self._started_tracemalloc = False
+        # Totals by fixture (see `serialize.add_fixture_stats()`), if timed
+        self._fixture_stats = None
+        # Details of the running test stage, to which fixture timings are added
+        self._stage_details = None
+        # The running collectors (node ID, start time and time spent in
+        # nested collectors), the import times of the modules and the timings
+        # of the finished collectors by node ID, if collection is timed
+        self._collect_stack = None
+        self._import_durations = None
+        self._collector_timings = None
+        self._collection_duration = None
+        # Whether only the outcomes of the tests are needed, see `--json-report-summary`
+        self._summary_only = False
 
     def pytest_configure(self, config):
         # When the plugin is used directly from code, it may have been
@@ -32,6 +71,44 @@ class JSONReportBase:
         # If the user sets --tb=no, always omit the traceback from the report
         if self._config.option.tbstyle == "no" and not self._must_omit("traceback"):
             self._config.option.json_report_omit.append("traceback")
+        option = self._config.option
+        # A summary has no collectors or warnings (the default list is shared,
+        # so it's not appended to)
+        if option.json_report_summary:
+            option.json_report_omit = [
+                *option.json_report_omit,
+                *(key for key in ("collectors", "warnings") if not self._must_omit(key)),
+            ]
+        # The per-test details are only needed for the database and the journal
+        self._summary_only = option.json_report_summary and not (
+            option.json_report_sqlite or option.json_report_journal
+        )
+        if self._config.option.json_report_overhead:
+            self._overhead = Overhead()
+        if self._config.option.json_report_fixtures:
+            self._fixture_stats = {}
+        if self._config.option.json_report_collection_timing:
+            self._collect_stack = []
+            self._import_durations = {}
+            self._collector_timings = {}
+        if self._config.option.json_report_resources and resource is None:
+            self._config.issue_config_time_warning(
+                pytest.PytestConfigWarning(
+                    "Resource usage can't be measured on this platform, ignoring "
+                    "--json-report-resources."
+                ),
+                stacklevel=2,
+            )
+            self._config.option.json_report_resources = False
+        if self._config.option.json_report_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def close(self):
+        """Release what the plugin holds when pytest is done."""
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
 
     def pytest_addhooks(self, pluginmanager):
         pluginmanager.add_hookspecs(Hooks)
@@ -39,79 +116,321 @@ class JSONReportBase:
     @pytest.hookimpl(hookwrapper=True)
     def pytest_runtest_protocol(self, item, nextitem):  # noqa: ARG002
         item._json_report_extra = {}
+        # `CallInfo` objects of the stages, which are not relayed by xdist
+        item._json_report_calls = {}
         yield
         del item._json_report_extra
+        del item._json_report_calls
+
+    def _measure(self, name):
+        """Return a context manager which adds the time spent in it to the overhead of `name`."""
+        if self._overhead is None:
+            return nullcontext()
+        return self._overhead.measure(name)
 
     @contextmanager
     def _capture_log(self, item, when):
-        handler = LoggingHandler()
+        start = time.perf_counter()
+        option = self._config.option
+        handler = LoggingHandler(
+            level=option.json_report_log_level,
+            fields=option.json_report_log_fields,
+            max_records=option.json_report_log_max_records,
+            max_size=option.json_report_log_max_size,
+        )
         self._logger.addHandler(handler)
+        # Only measure the time spent outside of the test
+        duration = time.perf_counter() - start
         try:
             yield
         finally:
+            start = time.perf_counter()
             self._logger.removeHandler(handler)
         item._json_report_extra[when]["log"] = handler.records
+        if handler.dropped:
+            item._json_report_extra[when]["log_dropped"] = handler.dropped
+        if self._overhead is not None:
+            duration += time.perf_counter() - start
+            self._overhead.add("_capture_log", duration, records=len(handler.records))
 
-    @pytest.hookimpl(hookwrapper=True)
-    def pytest_runtest_setup(self, item):
-        item._json_report_extra["setup"] = {}
-        if self._must_omit("log"):
+    def _resources_before(self):
+        """Return what is needed to measure the resources used from now on."""
+        option = self._config.option
+        rusage = resource.getrusage(resource.RUSAGE_SELF) if option.json_report_resources else None
+        allocated = None
+        if option.json_report_tracemalloc:
+            allocated, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        return rusage, allocated
+
+    @staticmethod
+    def _resources_used(before):
+        """Return the resources used since `_resources_before()` returned `before`."""
+        rusage, allocated = before
+        resources = {}
+        if allocated is not None:
+            _, peak = tracemalloc.get_traced_memory()
+            resources["alloc_peak"] = peak - allocated
+        if rusage is not None:
+            after = resource.getrusage(resource.RUSAGE_SELF)
+            # The times have a resolution of microseconds
+            resources["user_time"] = round(after.ru_utime - rusage.ru_utime, 6)
+            resources["system_time"] = round(after.ru_stime - rusage.ru_stime, 6)
+            resources["max_rss_delta"] = (after.ru_maxrss - rusage.ru_maxrss) * _MAXRSS_UNIT
+            resources["voluntary_switches"] = after.ru_nvcsw - rusage.ru_nvcsw
+            resources["involuntary_switches"] = after.ru_nivcsw - rusage.ru_nivcsw
+        return resources
+
+    @contextmanager
+    def _run_stage(self, item, when):
+        extra = item._json_report_extra[when] = {}
+        option = self._config.option
+        measure = not self._summary_only and (
+            option.json_report_resources or option.json_report_tracemalloc
+        )
+        if measure:
+            before = self._resources_before()
+        if self._fixture_stats is not None:
+            self._stage_details = extra
+        if self._summary_only or self._must_omit("log"):
             yield
         else:
-            with self._capture_log(item, "setup"):
+            with self._capture_log(item, when):
                 yield
+        if self._fixture_stats is not None:
+            self._stage_details = None
+            if when == "setup":
+                self._add_cached_fixtures(item, extra)
+        if measure:
+            extra["resources"] = self._resources_used(before)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_fixture_setup(self, fixturedef, request):  # noqa: ARG002
+        if self._fixture_stats is None:
+            yield
+            return
+        start = time.perf_counter()
+        yield
+        self._add_fixture_timing(fixturedef, setup_time=time.perf_counter() - start)
+        # Finalizers run in reverse order, so this one runs right before the
+        # fixture's own teardown, which ends with `pytest_fixture_post_finalizer`
+        fixturedef.addfinalizer(partial(self._start_fixture_teardown, fixturedef))
+
+    @staticmethod
+    def _start_fixture_teardown(fixturedef):
+        fixturedef._json_report_teardown_start = time.perf_counter()
+
+    def pytest_fixture_post_finalizer(self, fixturedef, request):  # noqa: ARG002
+        start = getattr(fixturedef, "_json_report_teardown_start", None)
+        if self._fixture_stats is None or start is None:
+            return
+        del fixturedef._json_report_teardown_start
+        self._add_fixture_timing(fixturedef, teardown_time=time.perf_counter() - start)
+
+    def _add_fixture_timing(self, fixturedef, setup_time=None, teardown_time=None):
+        """Add the setup or teardown time of a fixture to the stage and the totals."""
+        if self._stage_details is not None:
+            self._stage_details.setdefault("fixtures", []).append({
+                "name": fixturedef.argname,
+                "scope": fixturedef.scope,
+                "duration": teardown_time if setup_time is None else setup_time,
+            })
+        serialize.add_fixture_stats(
+            self._fixture_stats,
+            fixturedef.argname,
+            fixturedef.scope,
+            setups=int(setup_time is not None),
+            setup_time=setup_time or 0,
+            teardown_time=teardown_time or 0,
+        )
+
+    def _add_cached_fixtures(self, item, extra):
+        """Add the fixtures of `item` whose cached value was reused to its setup stage."""
+        fixtureinfo = getattr(item, "_fixtureinfo", None)
+        if fixtureinfo is None:
+            return
+        fixtures = extra.setdefault("fixtures", [])
+        set_up = {fixture["name"] for fixture in fixtures}
+        for name in item.fixturenames:
+            fixturedefs = fixtureinfo.name2fixturedefs.get(name)
+            # Fixtures after a failed one haven't been set up at all
+            if name in set_up or not fixturedefs or fixturedefs[-1].cached_result is None:
+                continue
+            scope = fixturedefs[-1].scope
+            fixtures.append({"name": name, "scope": scope, "cached": True})
+            serialize.add_fixture_stats(self._fixture_stats, name, scope, cache_hits=1)
+        if not fixtures:
+            del extra["fixtures"]
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_setup(self, item):
+        with self._run_stage(item, "setup"):
+            yield
 
     @pytest.hookimpl(hookwrapper=True)
     def pytest_runtest_call(self, item):
-        item._json_report_extra["call"] = {}
-        if self._must_omit("log"):
+        with self._run_stage(item, "call"):
             yield
-        else:
-            with self._capture_log(item, "call"):
-                yield
 
     @pytest.hookimpl(hookwrapper=True)
     def pytest_runtest_teardown(self, item):
-        item._json_report_extra["teardown"] = {}
-        if self._must_omit("log"):
+        with self._run_stage(item, "teardown"):
             yield
-        else:
-            with self._capture_log(item, "teardown"):
-                yield
 
     @pytest.hookimpl(hookwrapper=True)
     def pytest_runtest_makereport(self, item, call):
         # Hook runtest_makereport to access the item *and* the report
         report = (yield).get_result()
-        if not self._must_omit("streams"):
-            streams = {
-                key: val
-                for when_, key, val in item._report_sections
-                if when_ == report.when and key in {"stdout", "stderr"}
-            }
-            item._json_report_extra[call.when].update(streams)
-        for dict_ in self._config.hook.pytest_json_runtest_metadata(item=item, call=call):
-            if not dict_:
-                continue
-            item._json_report_extra.setdefault("metadata", {}).update(dict_)
-        self._validate_metadata(item)
+        # The outcome is all that's needed, which the report has anyway
+        if self._summary_only:
+            return
+        with self._measure("pytest_runtest_makereport"):
+            if not self._must_omit("streams"):
+                streams = {
+                    key: val
+                    for when_, key, val in item._report_sections
+                    if when_ == report.when and key in {"stdout", "stderr"}
+                }
+                max_bytes = self._config.option.json_report_streams_max_bytes
+                if max_bytes is not None:
+                    for key, val in list(streams.items()):
+                        streams[key], length = serialize.truncate_stream(val, max_bytes)
+                        if length is not None:
+                            streams[f"{key}_length"] = length
+                item._json_report_extra[call.when].update(streams)
+            for dict_ in self._config.hook.pytest_json_runtest_metadata(item=item, call=call):
+                if not dict_:
+                    continue
+                item._json_report_extra.setdefault("metadata", {}).update(dict_)
+            item._json_report_calls[call.when] = call
+            if call.when == "teardown":
+                item_metadata = self._get_item_metadata(item)
+                if item_metadata:
+                    item._json_report_extra.setdefault("metadata", {}).update(item_metadata)
+        with self._measure("_validate_metadata"):
+            self._validate_metadata(item)
+        if self._overhead is not None:
+            self._count_captured(item._json_report_extra[call.when])
         # Attach the JSON details to the report. If this is an xdist worker,
         # the details will be serialized and relayed with the other attributes
         # of the report.
         report._json_report_extra = item._json_report_extra
 
+    def _count_captured(self, stage_details):
+        """Add the streams and log records captured for a stage to the overhead."""
+        log = stage_details.get("log") or []
+        num_bytes = sum(
+            len(stage_details[key].encode()) for key in ("stdout", "stderr") if key in stage_details
+        )
+        if log:
+            num_bytes += _json_size(log)
+        self._overhead.count("pytest_runtest_makereport", records=len(log), num_bytes=num_bytes)
+
+    def _get_item_metadata(self, item):
+        """Return the merged results of `pytest_json_item_metadata` for `item`.
+
+        The results are memoized per session or module if requested.
+        """
+        scope = self._config.option.json_report_metadata_cache
+        if scope is not None:
+            key = item.path if scope == "module" else None
+            with suppress(KeyError):
+                return self._item_metadata_cache[key]
+        metadata = {}
+        for dict_ in self._config.hook.pytest_json_item_metadata(
+            item=item, calls=item._json_report_calls
+        ):
+            if dict_:
+                metadata.update(dict_)
+        if scope is not None:
+            self._item_metadata_cache[key] = metadata
+        return metadata
+
     @staticmethod
     def _validate_metadata(item):
         """Ensure that `item` has JSON-serializable metadata, otherwise delete it."""
         if "metadata" not in item._json_report_extra:
             return
-        if not serialize.serializable(item._json_report_extra["metadata"]):
-            warnings.warn(f"Metadata of {item.nodeid} is not JSON-serializable.", stacklevel=2)
+        path = serialize.find_unserializable(item._json_report_extra["metadata"])
+        if path is not None:
+            warnings.warn(
+                f"Metadata of {item.nodeid} is not JSON-serializable "
+                f"(at metadata{serialize.format_path(path)}).",
+                stacklevel=2,
+            )
             del item._json_report_extra["metadata"]
 
     def _must_omit(self, key):
         return key in self._config.option.json_report_omit
 
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_collection(self, session):  # noqa: ARG002
+        start = time.perf_counter()
+        yield
+        if self._collector_timings is not None:
+            self._collection_duration = time.perf_counter() - start
+
+    def pytest_collectstart(self, collector):
+        if self._collect_stack is not None:
+            self._collect_stack.append([collector.nodeid, time.perf_counter(), 0.0])
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_pycollect_makeitem(self, collector, name, obj):  # noqa: ARG002
+        # A module is imported (and its fixtures are registered) right before
+        # the first item is made from its attributes
+        if (
+            self._import_durations is not None
+            and isinstance(collector, pytest.Module)
+            and collector.nodeid not in self._import_durations
+        ):
+            nodeid, start, _ = self._collect_stack[-1]
+            if nodeid == collector.nodeid:
+                self._import_durations[nodeid] = time.perf_counter() - start
+        yield
+
+    def _time_collector(self, report):
+        """Return the timing of the collector of `report` (or None if not timed)."""
+        if self._collect_stack is None:
+            return None
+        for i in range(len(self._collect_stack) - 1, -1, -1):
+            if self._collect_stack[i][0] == report.nodeid:
+                _, start, nested = self._collect_stack.pop(i)
+                break
+        else:
+            return None
+        # Since pytest 8, directories collect their modules within their own
+        # collection, so the time of nested collectors is subtracted
+        total = time.perf_counter() - start
+        if self._collect_stack:
+            self._collect_stack[-1][2] += total
+        timing = {"duration": total - nested}
+        import_duration = self._import_durations.pop(report.nodeid, None)
+        if import_duration is not None:
+            timing["import_duration"] = import_duration
+        self._collector_timings[report.nodeid] = timing
+        return timing
+
+    def _make_collection(self):
+        """Return the collection time and the slowest collectors."""
+        slowest = heapq.nlargest(
+            self._config.option.json_report_slowest_collectors,
+            self._collector_timings.items(),
+            key=lambda entry: entry[1]["duration"],
+        )
+        return {
+            "duration": self._collection_duration,
+            "slowest": [{"nodeid": nodeid, **timing} for nodeid, timing in slowest],
+        }
+
+    def _send_worker_output(self):
+        """Send the overhead, fixture totals and collection of an xdist worker to the controller."""
+        if self._overhead is not None:
+            self._config.workeroutput["json_report_overhead"] = self._overhead.state
+        if self._fixture_stats is not None:
+            self._config.workeroutput["json_report_fixtures"] = list(self._fixture_stats.values())
+        if self._collector_timings is not None:
+            self._config.workeroutput["json_report_collection"] = self._make_collection()
+
 
 class JSONReport(JSONReportBase):
     """The JSON report pytest plugin."""
@@ -120,26 +439,117 @@ class JSONReport(JSONReportBase):
         JSONReportBase.__init__(self, *args, **kwargs)
         self._start_time = None
         self._json_tests = OrderedDict()
+        # Outcomes of tests which have already been written out and dropped
+        # from `_json_tests`
+        self._written_outcomes = Counter()
+        self._writer = None
+        self._encoder = None
         self._json_collectors = []
         self._json_warnings = []
         self._num_deselected = 0
+        # Directory of the report shards written by the xdist workers, if any
+        self._shard_dir = None
+        self._shard_paths = []
+        # Outcomes of the tests which are only counted (in summary mode or
+        # because their details are in a shard), until their teardown stage
+        # has been reported
+        self._pending_outcomes = {}
+        # Position of each test in the collection order, as reported by xdist
+        self._collection_index = None
+        # Collection time of the first xdist worker which finished
+        self._worker_collection = None
+        # Statistics of the test durations, if added to the summary
+        self._durations = None
+        # Unique failures of the tests, if deduplicated
+        self._failures = None
+        self._sink = None
+        self._journal = None
+        self._journal_collected = False
         self._terminal_summary = ""
+        # Lines about the database and the journal printed after the summary
+        self._terminal_lines = []
         # Min verbosity required to print to terminal
         self._terminal_min_verbosity = 0
         self.report = None
 
-    def pytest_sessionstart(self, session):  # noqa: ARG002
+    def pytest_sessionstart(self, session):
         self._start_time = time.time()
+        self._encoder = self._get_encoder()
+        option = self._config.option
+        if option.json_report_durations:
+            self._durations = DurationStats(top=option.json_report_slowest_tests)
+        if option.json_report_failures:
+            self._failures = FailureTable(
+                root=str(session.fspath),
+                invocation_dir=str(session.config.invocation_params.dir),
+            )
+        path = option.json_report_file
+        # A summary has no tests to stream
+        if (
+            path
+            and not option.json_report_summary
+            and (option.json_report_format == "jsonl" or option.json_report_stream)
+        ):
+            # If the file can't be opened, the tests are kept in memory and
+            # the error is reported when trying to save the report at the end
+            with suppress(OSError):
+                self._writer = self._in_background(self._make_writer(path))
+                self._writer.start_tests()
+        if option.json_report_sqlite:
+            try:
+                self._sink = SQLiteSink(option.json_report_sqlite)
+            except sqlite3.Error as e:
+                self._terminal_lines.append(f"could not open database: {e}")
+        if option.json_report_journal:
+            try:
+                self._journal = self._in_background(
+                    writers.JournalWriter(
+                        option.json_report_journal,
+                        encoder=self._encoder,
+                        sync_records=option.json_report_journal_sync_records,
+                        sync_interval=option.json_report_journal_sync_interval,
+                    )
+                )
+            except OSError as e:
+                self._terminal_lines.append(f"could not open journal: {e}")
+            else:
+                self._journal.start_session(
+                    created=self._start_time,
+                    root=str(session.fspath),
+                    environment=self._get_environment(),
+                )
+
+    def pytest_collection_finish(self, session):
+        # With xdist, the collection is reported by the workers
+        if self._journal is not None and getattr(session, "items", None):
+            self._write_journal_collection(len(session.items) + self._num_deselected)
+
+    def _write_journal_collection(self, collected):
+        if not self._journal_collected:
+            self._journal_collected = True
+            self._journal.write_collection(collected)
+
+    def pytest_runtest_logstart(self, nodeid, location):  # noqa: ARG002
+        if self._journal is not None:
+            self._journal.start_test(nodeid, time.time())
 
     def pytest_collectreport(self, report):
+        timing = self._time_collector(report)
         if self._must_omit("collectors"):
             return
+        start = time.perf_counter()
         json_result = []
         for item in report.result:
             json_item = serialize.make_collectitem(item)
             item._json_collectitem = json_item
             json_result.append(json_item)
-        self._json_collectors.append(serialize.make_collector(report, json_result))
+        self._json_collectors.append(
+            serialize.make_collector(report, json_result, **(timing or {}))
+        )
+        if self._overhead is not None:
+            self._overhead.add(
+                "pytest_collectreport", time.perf_counter() - start, records=len(json_result)
+            )
 
     def pytest_deselected(self, items):
         self._num_deselected += len(items)
@@ -162,7 +572,68 @@ class JSONReport(JSONReportBase):
             with suppress(AttributeError):
                 del item._json_collectitem
 
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_configure_node(self, node):
+        # The shards can only be merged if the worker runs on this machine. A
+        # summary doesn't need them, as the workers relay no details anyway.
+        if (
+            not self._config.option.json_report_xdist_shards
+            or not node.gateway.spec.popen
+            or self._summary_only
+        ):
+            return
+        if self._shard_dir is None:
+            self._shard_dir = tempfile.mkdtemp(prefix="pytest-json-report-")
+        fd, path = tempfile.mkstemp(suffix=".jsonl", dir=self._shard_dir)
+        os.close(fd)
+        self._shard_paths.append(path)
+        node.workerinput["json_report_shard"] = path
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_xdist_node_collection_finished(self, node, ids):  # noqa: ARG002
+        if self._journal is not None:
+            self._write_journal_collection(len(ids))
+        if self._shard_dir is not None and self._collection_index is None:
+            self._collection_index = {nodeid: i for i, nodeid in enumerate(ids)}
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):  # noqa: ARG002
+        # A crashed worker doesn't send its output
+        output = getattr(node, "workeroutput", {})
+        if self._overhead is not None and output.get("json_report_overhead"):
+            self._overhead.merge(output["json_report_overhead"])
+        if self._fixture_stats is not None:
+            for entry in output.get("json_report_fixtures", []):
+                serialize.add_fixture_stats(self._fixture_stats, **entry)
+        # Every worker collects all tests, so the first one is as good as any
+        if self._worker_collection is None:
+            self._worker_collection = output.get("json_report_collection")
+
     def pytest_runtest_logreport(self, report):
+        with self._measure("pytest_runtest_logreport"):
+            if self._durations is not None:
+                self._durations.add_stage(report.nodeid, report.when, report.duration)
+            stage = self._add_report(report)
+        if self._overhead is not None and stage is not None:
+            if isinstance(stage, serialize.TestStage):
+                stage = stage.to_dict()
+            self._overhead.count("pytest_runtest_logreport", records=1, num_bytes=_json_size(stage))
+
+    def _add_report(self, report):
+        """Add the test stage `report` and return its JSON representation.
+
+        Returns None if the stage is only counted, not kept.
+        """
+        if self._summary_only or getattr(report, "_json_report_shard", False):
+            self._count_outcome(report)
+            # Failures are counted for the summary even without the tests
+            if self._summary_only and self._failures is not None and report.failed:
+                self._failures.add_stage(
+                    serialize.make_teststage(
+                        report, None, None, None, self._must_omit("traceback")
+                    ).to_dict()
+                )
+            return
         # The `_json_report_extra` attr may have been lost, e.g. when the
         # original report object got replaced due to a crashed xdist worker (#75)
         if not hasattr(report, "_json_report_extra"):
@@ -182,24 +653,112 @@ class JSONReport(JSONReportBase):
             self._json_tests[nodeid] = json_testitem
         metadata = report._json_report_extra.get("metadata")
         if metadata:
-            json_testitem["metadata"] = metadata
+            json_testitem.metadata = metadata
         # Add user properties in teardown stage if attribute exists and is non-empty
         if report.when == "teardown" and getattr(report, "user_properties", None):
             user_properties = [{str(key): val} for key, val in report.user_properties]
-            if serialize.serializable(user_properties):
-                json_testitem["user_properties"] = user_properties
+            path = serialize.find_unserializable(user_properties)
+            if path is None:
+                json_testitem.user_properties = user_properties
             else:
-                warnings.warn(f"User properties of {nodeid} are not JSON-serializable.", stacklevel=2)
+                warnings.warn(
+                    f"User properties of {nodeid} are not JSON-serializable "
+                    f"(at user_properties{serialize.format_path(path)}).",
+                    stacklevel=2,
+                )
 
         # Update total test outcome, if necessary. The total outcome can be
         # different from the outcome of the setup/call/teardown stage.
         outcome = self._config.hook.pytest_report_teststatus(report=report, config=self._config)[0]
         if outcome not in {"passed", ""}:
-            json_testitem["outcome"] = outcome
-        json_testitem[report.when] = self._config.hook.pytest_json_runtest_stage(report=report)
+            json_testitem.outcome = outcome
+        stage = self._make_stage(report)
+        json_testitem.set_stage(report.when, stage)
+        # With shards, the tests are added to the sinks when merging them
+        if report.when == "teardown" and self._has_sinks() and self._shard_dir is None:
+            self._add_to_sinks(json_testitem.to_dict())
+        if report.when == "teardown" and self._writer is not None:
+            self._write_test(nodeid)
+        return stage
+
+    def _count_outcome(self, report):
+        """Keep track of the outcome of a test whose details aren't kept.
+
+        Only the outcome of each running test is held until its teardown
+        stage, after which it's counted.
+        """
+        nodeid = report.nodeid
+        outcome = self._config.hook.pytest_report_teststatus(report=report, config=self._config)[0]
+        if outcome not in {"passed", ""}:
+            self._pending_outcomes[nodeid] = outcome
+        else:
+            self._pending_outcomes.setdefault(nodeid, "passed")
+        if report.when == "teardown":
+            self._written_outcomes[self._pending_outcomes.pop(nodeid)] += 1
+
+    def _merge_shards(self):
+        """Return an iterator over the tests of the worker shards in collection order.
+
+        Tests which have been relayed in full (e.g. because their worker
+        crashed) are merged in as well. All tests are counted as written. The
+        shards are already in collection order, because the workers run their
+        tests in that order.
+        """
+        for nodeid, outcome in self._pending_outcomes.items():
+            # A test whose worker crashed has been reported in full again
+            if nodeid not in self._json_tests:
+                self._written_outcomes[outcome] += 1
+        self._pending_outcomes.clear()
+        index = self._collection_index or {}
+
+        def key(test):
+            return index.get(test["nodeid"], len(index))
+
+        relayed = sorted((test.to_dict() for test in self._json_tests.values()), key=key)
+        self._written_outcomes.update(test.outcome for test in self._json_tests.values())
+        self._json_tests.clear()
+        shards = [writers.read_tests(path) for path in self._shard_paths]
+        return heapq.merge(relayed, *shards, key=key)
+
+    def _has_sinks(self):
+        return self._sink is not None or self._journal is not None
+
+    def _add_to_sinks(self, test):
+        """Add the test dict `test` to the database and the journal."""
+        if self._sink is not None:
+            self._sink.add_test(test)
+        if self._journal is not None:
+            self._journal.write_test(test)
+
+    def _write_test(self, nodeid):
+        """Write out the finished test `nodeid` and drop it from memory."""
+        json_testitem = self._json_tests.pop(nodeid)
+        self._written_outcomes[json_testitem.outcome] += 1
+        self._writer.write_test(self._deduplicate(json_testitem.to_dict()))
+
+    def _deduplicate(self, test):
+        """Return the test dict `test` with its failures moved to the failures table, if any."""
+        if self._failures is None:
+            return test
+        return self._failures.add_test(test)
+
+    def _make_stage(self, report):
+        """Return the JSON representation of the test stage `report`.
+
+        Unless other plugins implement `pytest_json_runtest_stage`, the hook
+        isn't called and the stage is kept as a `serialize.TestStage`, which
+        takes less memory than the dict the hook returns.
+        """
+        hook = self._config.hook.pytest_json_runtest_stage
+        if len(hook.get_hookimpls()) == 1:
+            return self._make_teststage(report)
+        return hook(report=report)
 
     @pytest.hookimpl(trylast=True)
     def pytest_json_runtest_stage(self, report):
+        return self._make_teststage(report).to_dict()
+
+    def _make_teststage(self, report):
         stage_details = report._json_report_extra.get(report.when, {})
         return serialize.make_teststage(
             report,
@@ -207,47 +766,135 @@ class JSONReport(JSONReportBase):
             stage_details.get("stderr"),
             stage_details.get("log"),
             self._must_omit("traceback"),
+            log_dropped=stage_details.get("log_dropped"),
+            stdout_length=stage_details.get("stdout_length"),
+            stderr_length=stage_details.get("stderr_length"),
+            resources=stage_details.get("resources"),
+            fixtures=stage_details.get("fixtures"),
         )
 
     @pytest.hookimpl(tryfirst=True)
     def pytest_sessionfinish(self, session):
-        summary_data = {
-            # Need to add deselected count to get correct number of collected
-            # tests (see pytest-dev/pytest#9614)
-            "collected": session.testscollected + self._num_deselected
-        }
-        if self._num_deselected:
-            summary_data["deselected"] = self._num_deselected
+        tests = self._finish_tests()
+        json_report = self._make_report(session, tests)
+        self._config.hook.pytest_json_modifyreport(json_report=json_report)
+        # After the session has finished, other scripts may want to use report
+        # object directly
+        self.report = json_report
+        self._save_report(json_report)
+        self._finish_sinks(json_report)
+        if self._shard_dir is not None:
+            shutil.rmtree(self._shard_dir, ignore_errors=True)
 
-        metadata = {}
-        if self._config.pluginmanager.getplugin("metadata"):
-            from pytest_metadata.plugin import metadata_key
+    def _finish_tests(self):
+        """Pass the tests which haven't been passed on yet to the sinks and the writer.
+
+        These are the tests without a teardown stage (e.g. due to a crashed
+        xdist worker) and the tests of the worker shards. Return the test
+        dicts to put in the report, or None if they have been streamed or
+        aren't wanted.
+        """
+        in_report = self._writer is None and not self._config.option.json_report_summary
+        if self._shard_dir is not None:
+            tests = self._finish_merged_tests(self._merge_shards(), in_report)
+        elif self._writer is not None:
+            tests = None
+            for nodeid in list(self._json_tests):
+                if self._has_sinks():
+                    self._add_to_sinks(self._json_tests[nodeid].to_dict())
+                self._write_test(nodeid)
+        else:
+            tests = [] if in_report else None
+            for test in self._json_tests.values():
+                test_dict = test.to_dict()
+                if self._has_sinks() and test.teardown is None:
+                    self._add_to_sinks(test_dict)
+                if tests is not None or self._failures is not None:
+                    test_dict = self._deduplicate(test_dict)
+                if tests is not None:
+                    tests.append(test_dict)
+        # Tests without a teardown stage (e.g. due to a crashed xdist worker)
+        # haven't been counted yet
+        self._written_outcomes.update(self._pending_outcomes.values())
+        self._pending_outcomes.clear()
+        return tests
 
-            metadata = self._config.stash[metadata_key]
+    def _finish_merged_tests(self, merged_tests, in_report):
+        """Pass the merged tests of the worker shards on to the sinks and the writer.
 
+        Return the test dicts to put in the report if `in_report`, else None.
+        """
+        tests = [] if in_report else None
+        for test in merged_tests:
+            if self._has_sinks():
+                self._add_to_sinks(test)
+            deduplicated = self._deduplicate(test)
+            if self._writer is not None:
+                self._writer.write_test(deduplicated)
+            elif tests is not None:
+                tests.append(deduplicated)
+        return tests
+
+    def _make_report(self, session, tests):
+        """Return the report of the finished session with the test dicts `tests`, if any."""
         json_report = serialize.make_report(
             created=time.time(),
             duration=time.time() - self._start_time,
             exitcode=session.exitstatus,
             root=str(session.fspath),
-            environment=metadata,
-            summary=serialize.make_summary(self._json_tests, **summary_data),
+            environment=self._get_environment(),
+            summary=self._make_summary(session),
         )
         if not self._config.option.json_report_summary:
             if self._json_collectors:
                 json_report["collectors"] = self._json_collectors
-            json_report["tests"] = list(self._json_tests.values())
+            if tests is not None:
+                json_report["tests"] = tests
             if self._json_warnings:
                 json_report["warnings"] = self._json_warnings
+        # All tests have been deduplicated by now
+        if self._failures is not None:
+            json_report["summary"]["failures"] = self._failures.counts()
+            json_report["failures"] = self._failures.to_list()
+        if self._collector_timings is not None:
+            # With xdist, the controller doesn't collect anything itself
+            json_report["collection"] = (
+                self._worker_collection
+                if not self._collector_timings and self._worker_collection is not None
+                else self._make_collection()
+            )
+        if self._fixture_stats is not None:
+            json_report["fixtures"] = serialize.make_fixtures(self._fixture_stats)
+        if self._overhead is not None:
+            json_report["plugin_overhead"] = self._overhead.to_dict()
+        return json_report
 
-        self._config.hook.pytest_json_modifyreport(json_report=json_report)
-        # After the session has finished, other scripts may want to use report
-        # object directly
-        self.report = json_report
+    def _make_summary(self, session):
+        summary_data = {
+            # Need to add deselected count to get correct number of collected
+            # tests (see pytest-dev/pytest#9614)
+            "collected": session.testscollected + self._num_deselected
+        }
+        if self._num_deselected:
+            summary_data["deselected"] = self._num_deselected
+        if self._durations is not None:
+            summary_data["durations"] = self._durations.to_dict()
+        return serialize.make_summary(
+            self._json_tests, counts=self._written_outcomes, **summary_data
+        )
+
+    def _save_report(self, json_report):
+        """Write `json_report` to the report file, unless auto-saving is disabled."""
         path = self._config.option.json_report_file
-        if path:
+        start = time.perf_counter()
+        if self._writer is not None or path:
             try:
-                self.save_report(path)
+                # The tests may already have been streamed, in which case
+                # only the remaining keys need to be written
+                self._write_report(
+                    self._make_writer(path) if self._writer is None else self._writer,
+                    json_report,
+                )
             except OSError as e:
                 self._terminal_summary = f"could not save report: {e}"
             else:
@@ -255,32 +902,128 @@ class JSONReport(JSONReportBase):
         else:
             self._terminal_summary = "report auto-save skipped"
             self._terminal_min_verbosity = 1
+        if self._overhead is not None:
+            self._terminal_lines.append(self._format_overhead(time.perf_counter() - start, path))
+
+    def _finish_sinks(self, json_report):
+        """Add the session keys of `json_report` to the database and the journal."""
+        if self._sink is not None:
+            try:
+                self._sink.finish(json_report)
+            except sqlite3.Error as e:
+                self._terminal_lines.append(f"could not write to database: {e}")
+            else:
+                self._terminal_lines.append(
+                    f"results added to database: {self._config.option.json_report_sqlite}"
+                )
+        if self._journal is not None:
+            try:
+                for key, val in json_report.items():
+                    if key != "tests":
+                        self._journal.write_member(key, val)
+                self._journal.finish()
+            except OSError as e:
+                self._terminal_lines.append(f"could not write journal: {e}")
+
+    def _write_report(self, writer, report):
+        """Write `report` with `writer` and finish it.
+
+        The `plugin_overhead` key is written last, so that its `serialization`
+        time and `serialization_bytes` cover writing the rest of the report.
+        """
+        overhead = report.get("plugin_overhead")
+        if overhead is None:
+            writers.write_report(writer, report)
+            return
+        # Tests which have already been streamed aren't counted
+        num_bytes = writer.bytes_written
+        start = time.perf_counter()
+        writers.write_report(
+            writer,
+            {key: val for key, val in report.items() if key != "plugin_overhead"},
+            finish=False,
+        )
+        num_bytes = writer.bytes_written - num_bytes
+        overhead["serialization"] = time.perf_counter() - start
+        overhead["serialization_bytes"] = num_bytes
+        writer.write_member("plugin_overhead", overhead)
+        writer.finish()
+
+    def _format_overhead(self, serialization, path):
+        """Return the terminal line about the overhead of the plugin."""
+        total = self._overhead.to_dict()["total"]
+        line = f"plugin overhead: {total:.3f}s in hooks, {serialization:.3f}s writing the report"
+        with suppress(OSError, TypeError):
+            line += f" ({Path(path).stat().st_size} bytes)"
+        return line
+
+    def _get_environment(self):
+        if self._config.pluginmanager.getplugin("metadata"):
+            from pytest_metadata.plugin import metadata_key
+
+            return self._config.stash[metadata_key]
+        return {}
 
     def save_report(self, path: Path | str) -> None:
         """Save the JSON report to `path`.
 
         Raises an exception if saving failed.
         """
-        path = Path(path)
         if self.report is None:
             msg = "could not save report: no report available"
             raise JSONReportError(msg)
-        # Create path if it doesn't exist
-        dirname = path.parent
-        if dirname:
-            try:
-                dirname.mkdir(parents=True)
-            # Mimick FileExistsError for py2.7 compatibility
-            except OSError as e:
-                if e.errno != errno.EEXIST:
-                    raise
-        with path.open("w", encoding="utf-8") as f:
-            json.dump(
-                self.report,
-                f,
-                default=str,
-                indent=self._config.option.json_report_indent,
+        writers.write_report(self._make_writer(path), self.report)
+
+    def _make_writer(self, path):
+        option = self._config.option
+        jsonl = option.json_report_format == "jsonl"
+        # The tests of a compact report can't be decoded on their own
+        index = option.json_report_index and not option.json_report_compact
+        if jsonl:
+            writer = writers.JSONLinesWriter(
+                path,
+                encoder=self._encoder,
+                compresslevel=option.json_report_compresslevel,
+                index=index,
+            )
+        else:
+            writer = writers.JSONWriter(
+                path,
+                indent=option.json_report_indent,
+                encoder=self._encoder,
+                compresslevel=option.json_report_compresslevel,
+                index=index,
             )
+        if option.json_report_compact:
+            return compact.CompactWriter(writer, incremental=jsonl)
+        return writer
+
+    def _in_background(self, writer):
+        """Return `writer` wrapped to write on a background thread, if enabled."""
+        option = self._config.option
+        if not option.json_report_writer_thread:
+            return writer
+        return writers.ThreadedWriter(writer, queue_size=option.json_report_writer_queue_size)
+
+    def close(self):
+        """Close the report file and the journal if the session didn't finish them."""
+        for writer in (self._writer, self._journal):
+            if writer is not None:
+                writer.close()
+        super().close()
+
+    def _get_encoder(self):
+        name = self._config.option.json_report_encoder
+        try:
+            return encoders.get_encoder(name)
+        except ImportError:
+            self._config.issue_config_time_warning(
+                pytest.PytestConfigWarning(
+                    f"JSON encoder {name!r} is not installed, using the stdlib encoder instead."
+                ),
+                stacklevel=2,
+            )
+            return encoders.StdlibEncoder()
 
     def pytest_warning_recorded(self, warning_message, when):
         if self._config is None:
@@ -304,24 +1047,167 @@ class JSONReport(JSONReportBase):
             return
         terminalreporter.write_sep("-", "JSON report")
         terminalreporter.write_line(self._terminal_summary)
+        for line in self._terminal_lines:
+            terminalreporter.write_line(line)
 
 
 class JSONReportWorker(JSONReportBase):
-    pass
+    def pytest_collectreport(self, report):
+        self._time_collector(report)
+
+    def pytest_sessionfinish(self, session):  # noqa: ARG002
+        self._send_worker_output()
+
+
+class JSONReportShardWorker(JSONReport):
+    """xdist worker which writes its tests to a report shard on local disk.
+
+    The test reports are relayed to the controller without the JSON details,
+    and the controller merges the shards when the session has finished.
+    """
+
+    def pytest_sessionstart(self, session):  # noqa: ARG002
+        # If the shard can't be opened, the details are relayed as usual
+        with suppress(OSError):
+            self._writer = self._in_background(
+                writers.JSONLinesWriter(
+                    self._config.workerinput["json_report_shard"], encoder=self._get_encoder()
+                )
+            )
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_logreport(self, report):
+        # Runs before xdist relays the report to the controller
+        if self._writer is None:
+            return
+        super().pytest_runtest_logreport(report)
+        del report._json_report_extra
+        report._json_report_shard = True
+
+    def _write_test(self, nodeid):
+        super()._write_test(nodeid)
+        # Keep the finished tests if the worker crashes
+        self._writer.flush()
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_sessionfinish(self, session):  # noqa: ARG002
+        self._send_worker_output()
+        if self._writer is None:
+            return
+        for nodeid in list(self._json_tests):
+            self._write_test(nodeid)
+        try:
+            self._writer.finish()
+        except OSError as e:
+            warnings.warn(f"could not write report shard: {e}", stacklevel=2)
+
+    # Collectors and warnings are reported by the controller
+    def pytest_collectreport(self, report):
+        self._time_collector(report)
+
+    def pytest_warning_recorded(self, warning_message, when): ...
+
+    def pytest_terminal_summary(self, terminalreporter): ...
 
 
 class LoggingHandler(logging.Handler):
-    def __init__(self):
-        super().__init__()
-        self.records = []
+    """Collect log records as dicts.
+
+    Only the record attributes listed in `fields` are kept (or all of them if
+    `fields` is None). If the records exceed `max_records` or their JSON
+    encoding exceeds `max_size` bytes in total, the first and the last
+    records are kept within half of the limits each and the ones in between
+    are dropped.
+    """
+
+    def __init__(self, level=logging.NOTSET, fields=None, max_records=None, max_size=None):
+        super().__init__(level)
+        self._fields = fields
+        self._max_head_records = None if max_records is None else max_records // 2
+        self._max_tail_records = None if max_records is None else max_records - max_records // 2
+        self._max_head_size = None if max_size is None else max_size // 2
+        self._max_tail_size = None if max_size is None else max_size - max_size // 2
+        self._head = []
+        self._head_size = 0
+        self._head_full = False
+        # The records with their sizes
+        self._tail = deque()
+        self._tail_size = 0
+        self.dropped = 0
+
+    @property
+    def records(self):
+        return self._head + [d for d, _ in self._tail]
 
     def emit(self, record):
-        d = dict(record.__dict__)
+        if self._fields is None:
+            d = dict(record.__dict__)
+            d.pop("message", None)
+        else:
+            d = {key: getattr(record, key) for key in self._fields if hasattr(record, key)}
         d["msg"] = record.getMessage()
-        d["args"] = None
-        d["exc_info"] = None
-        d.pop("message", None)
-        self.records.append(d)
+        if "args" in d:
+            d["args"] = None
+        if "exc_info" in d:
+            d["exc_info"] = None
+        # The size is only needed for the size limit
+        size = 0 if self._max_head_size is None else len(json.dumps(d, default=str).encode())
+        self._add(d, size)
+
+    def _add(self, d, size):
+        if not self._head_full:
+            if _within(len(self._head) + 1, self._max_head_records) and _within(
+                self._head_size + size, self._max_head_size
+            ):
+                self._head.append(d)
+                self._head_size += size
+                return
+            self._head_full = True
+        self._tail.append((d, size))
+        self._tail_size += size
+        while self._tail and not (
+            _within(len(self._tail), self._max_tail_records)
+            and _within(self._tail_size, self._max_tail_size)
+        ):
+            self._tail_size -= self._tail.popleft()[1]
+            self.dropped += 1
+
+
+def _json_size(value):
+    """Return the number of bytes of `value` encoded as JSON."""
+    return len(json.dumps(value, default=str).encode())
+
+
+def _within(value, limit):
+    return limit is None or value <= limit
+
+
+def _log_level(value):
+    """Return the numeric log level of a level name or number."""
+    if value.isdigit():
+        return int(value)
+    level = logging.getLevelName(value.upper())
+    if not isinstance(level, int):
+        msg = f"invalid log level: {value!r}"
+        raise argparse.ArgumentTypeError(msg)
+    return level
+
+
+def _non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        msg = f"must not be negative: {value!r}"
+        raise argparse.ArgumentTypeError(msg)
+    return number
+
+
+def _compresslevel(value):
+    """Return the compression level `value`, which is checked for the report format later."""
+    level = int(value)
+    if level not in range(10):
+        msg = f"invalid compression level: {value!r} (must be 0-9)"
+        raise argparse.ArgumentTypeError(msg)
+    return level
 
 
 class Hooks:
@@ -348,6 +1234,16 @@ class Hooks:
         current test run.
         """
 
+    def pytest_json_item_metadata(self, item, calls):
+        """Return a dict which will be added to the test item's JSON metadata.
+
+        Called once per test item from `pytest_runtest_makereport` of the
+        teardown stage. `calls` maps the names of the stages that ran to their
+        `CallInfo`. With `--json-report-metadata-cache`, the hook is only
+        called for the first item of each module or of the session and the
+        result is reused for the other items.
+        """
+
 
 @pytest.fixture
 def json_metadata(request):
@@ -381,12 +1277,199 @@ def pytest_addoption(parser):
         "omit in the report (choose from: collectors, log, traceback, "
         "streams, warnings, keywords)",
     )
+    group.addoption(
+        "--json-report-streams-max-bytes",
+        type=_non_negative_int,
+        help="max size of the captured stdout and stderr of a test stage in bytes "
+        "(the first and last bytes are kept)",
+    )
+    group.addoption(
+        "--json-report-log-level",
+        default=logging.NOTSET,
+        type=_log_level,
+        help="minimum level of log records to capture in the report (name or number)",
+    )
+    group.addoption(
+        "--json-report-log-fields",
+        default=None,
+        nargs="+",
+        help="list of log record attributes to keep in the report (msg is always kept)",
+    )
+    group.addoption(
+        "--json-report-log-max-records",
+        type=_non_negative_int,
+        help="max number of log records per test stage (the first and last records are kept)",
+    )
+    group.addoption(
+        "--json-report-log-max-size",
+        type=_non_negative_int,
+        help="max total size of the log records per test stage in bytes of JSON "
+        "(the first and last records are kept)",
+    )
+    group.addoption(
+        "--json-report-metadata-cache",
+        choices=["session", "module"],
+        help="call the pytest_json_item_metadata hook only once per session or module "
+        "and reuse its result for all test items",
+    )
     group.addoption(
         "--json-report-summary",
         default=False,
         action="store_true",
         help="only create a summary without per-test details",
     )
+    group.addoption(
+        "--json-report-format",
+        default="json",
+        choices=["json", "jsonl"],
+        help="format of the report file: a single JSON document (json) or JSON "
+        "Lines with one line per test and a final session line (jsonl)",
+    )
+    group.addoption(
+        "--json-report-stream",
+        default=False,
+        action="store_true",
+        help="write each test to the report file as soon as it has finished "
+        "instead of keeping all tests in memory until the end of the session",
+    )
+    group.addoption(
+        "--json-report-compact",
+        default=False,
+        action="store_true",
+        help="write node IDs, keywords and traceback paths as indices into a table "
+        "of distinct strings (see pytest_json_report.compact to expand the report)",
+    )
+    group.addoption(
+        "--json-report-xdist-shards",
+        default=False,
+        action="store_true",
+        help="let local xdist workers write the test details to report shards on disk "
+        "which are merged at the end, instead of sending them to the controller",
+    )
+    group.addoption(
+        "--json-report-index",
+        default=False,
+        action="store_true",
+        help="write an index of the tests next to the report (PATH.idx) to read single "
+        "tests quickly with 'python -m pytest_json_report show'",
+    )
+    group.addoption(
+        "--json-report-sqlite",
+        metavar="PATH",
+        help="also add the results to the SQLite database at PATH (created if needed)",
+    )
+    group.addoption(
+        "--json-report-journal",
+        metavar="PATH",
+        help="write a journal of the session to PATH while it runs, from which a report "
+        "can be recovered with 'python -m pytest_json_report recover' if the session is killed",
+    )
+    group.addoption(
+        "--json-report-journal-sync-records",
+        type=int,
+        default=100,
+        metavar="N",
+        help="sync the journal to disk after every N records (default 100)",
+    )
+    group.addoption(
+        "--json-report-journal-sync-interval",
+        type=float,
+        default=1.0,
+        metavar="SECONDS",
+        help="sync the journal to disk at least every SECONDS seconds (default 1.0)",
+    )
+    group.addoption(
+        "--json-report-writer-thread",
+        default=False,
+        action="store_true",
+        help="encode and write the streamed report and the journal on a background thread",
+    )
+    group.addoption(
+        "--json-report-writer-queue-size",
+        type=int,
+        default=1000,
+        metavar="N",
+        help="max number of writes waiting for the background thread before tests wait "
+        "for it (default 1000)",
+    )
+    group.addoption(
+        "--json-report-resources",
+        default=False,
+        action="store_true",
+        help="record the CPU time, growth of the max RSS and context switches of each test "
+        "stage (not available on Windows)",
+    )
+    group.addoption(
+        "--json-report-tracemalloc",
+        default=False,
+        action="store_true",
+        help="record the peak of the memory allocated by each test stage using tracemalloc "
+        "(slows down the tests considerably)",
+    )
+    group.addoption(
+        "--json-report-fixtures",
+        default=False,
+        action="store_true",
+        help="record the setup and teardown time of the fixtures of each test stage and "
+        "add a table of the most expensive fixtures to the report",
+    )
+    group.addoption(
+        "--json-report-collection-timing",
+        default=False,
+        action="store_true",
+        help="record the time taken to collect each collector and to import each test module, "
+        "and list the slowest collectors",
+    )
+    group.addoption(
+        "--json-report-slowest-collectors",
+        type=int,
+        default=10,
+        metavar="N",
+        help="number of slowest collectors to list with --json-report-collection-timing "
+        "(default 10)",
+    )
+    group.addoption(
+        "--json-report-failures",
+        default=False,
+        action="store_true",
+        help="store each unique failure once in a failures table and count the failures "
+        "by fingerprint in the summary",
+    )
+    group.addoption(
+        "--json-report-durations",
+        default=False,
+        action="store_true",
+        help="add percentiles and a histogram of the test and stage durations and the "
+        "slowest tests and stages to the summary",
+    )
+    group.addoption(
+        "--json-report-slowest-tests",
+        type=_non_negative_int,
+        default=10,
+        metavar="N",
+        help="number of slowest tests and stages to list with --json-report-durations "
+        "(default 10)",
+    )
+    group.addoption(
+        "--json-report-overhead",
+        default=False,
+        action="store_true",
+        help="measure the time taken by the plugin itself and add it to the report "
+        "as plugin_overhead",
+    )
+    group.addoption(
+        "--json-report-encoder",
+        default="stdlib",
+        choices=["auto", *encoders.ENCODERS],
+        help="JSON encoder used to write the report (orjson and msgspec must be installed "
+        "separately, auto uses the fastest one available)",
+    )
+    group.addoption(
+        "--json-report-compresslevel",
+        type=_compresslevel,
+        help="compression level used if the report file ends with .gz (0-9, default 6), "
+        ".xz (0-9, default 6) or .bz2 (1-9, default 9)",
+    )
     group.addoption(
         "--json-report-indent", type=int, help="pretty-print JSON with specified indentation level"
     )
@@ -398,7 +1481,30 @@ def pytest_addoption(parser):
 def pytest_configure(config):
     if not config.option.json_report:
         return
-    Plugin = JSONReportWorker if hasattr(config, "workerinput") else JSONReport  # noqa: N806
+    if config.option.json_report_file is not None:
+        try:
+            writers.check_compresslevel(
+                config.option.json_report_file, config.option.json_report_compresslevel
+            )
+        except ValueError as e:
+            raise pytest.UsageError(str(e)) from None
+    journal = config.option.json_report_journal
+    if (
+        journal is not None
+        and Path(journal).suffix in writers.COMPRESSORS
+        and Path(journal).suffix not in writers.FLUSHABLE_COMPRESSORS
+    ):
+        msg = (
+            f"the journal can't be compressed with {Path(journal).suffix}, as it couldn't "
+            "be recovered if the session is killed (use .gz or no compression)"
+        )
+        raise pytest.UsageError(msg)
+    if not hasattr(config, "workerinput"):
+        Plugin = JSONReport  # noqa: N806
+    elif "json_report_shard" in config.workerinput:
+        Plugin = JSONReportShardWorker  # noqa: N806
+    else:
+        Plugin = JSONReportWorker  # noqa: N806
     plugin = Plugin(config)
     config._json_report = plugin
     config.pluginmanager.register(plugin)
@@ -408,4 +1514,5 @@ def pytest_unconfigure(config):
     plugin = getattr(config, "_json_report", None)
     if plugin is not None:
         del config._json_report
+        plugin.close()
         config.pluginmanager.unregister(plugin)
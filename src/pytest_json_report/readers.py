@@ -0,0 +1,61 @@
+"""Read reports written by the plugin, in any of its formats."""
+
+import bz2
+import gzip
+import itertools
+import json
+import lzma
+from pathlib import Path
+
+from . import compact
+from .writers import RECORD_TYPE_KEY
+
+# Openers of compressed formats by file suffix
+DECOMPRESSORS = {
+    ".gz": gzip.open,
+    ".xz": lzma.open,
+    ".bz2": bz2.open,
+}
+
+
+def open_report(path):
+    """Open the report at `path` for reading, decompressing it if needed."""
+    path = Path(path)
+    try:
+        opener = DECOMPRESSORS[path.suffix]
+    except KeyError:
+        return path.open(encoding="utf-8")
+    return opener(path, "rt", encoding="utf-8")
+
+
+def iter_records(path):
+    """Yield the records of the report at `path` as in the JSON Lines format.
+
+    The report may be in the standard or the JSON Lines format, compressed
+    and/or compact. Each test is yielded as a "test" record and the other keys
+    of the report as a final "session" record. Tests of a JSON Lines report
+    are read one at a time, while a standard report is loaded at once.
+    """
+    with open_report(path) as f:
+        first_line = f.readline()
+        try:
+            record = json.loads(first_line)
+        except json.JSONDecodeError:
+            # An indented report in the standard format
+            record = json.loads(first_line + f.read())
+        if RECORD_TYPE_KEY in record:
+            lines = (json.loads(line) for line in f if line.strip())
+            yield from compact.expand_records(itertools.chain([record], lines))
+            return
+    report = compact.expand_report(record)
+    tests = report.pop("tests", [])
+    for test in tests:
+        yield {RECORD_TYPE_KEY: "test", **test}
+    yield {RECORD_TYPE_KEY: "session", **report}
+
+
+def iter_tests(path):
+    """Yield the test dicts of the report at `path`, see `iter_records()`."""
+    for record in iter_records(path):
+        if record.pop(RECORD_TYPE_KEY, None) == "test":
+            yield record
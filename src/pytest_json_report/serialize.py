@@ -1,20 +1,77 @@
 """Functions for making test data JSON-serializable."""
 
 import contextlib
-import json
 from collections import Counter
+from dataclasses import dataclass
+
+STAGES = ("setup", "call", "teardown")
+
+# Keys of a test dict which don't hold a test stage
+NON_STAGE_KEYS = frozenset([
+    "nodeid",
+    "lineno",
+    "outcome",
+    "keywords",
+    "metadata",
+    "user_properties",
+])
+
+
+# Types (and their subclasses) which `json.dumps()` accepts as values and as
+# dict keys without a `default` function, besides containers
+_JSON_SCALARS = (str, int, float, type(None))
 
 
 def serializable(obj):
     """Return whether `obj` is JSON-serializable."""
-    try:
-        json.dumps(obj)
-    except (TypeError, OverflowError):
-        return False
-    return True
+    return find_unserializable(obj) is None
+
+
+def find_unserializable(obj):
+    """Return the path of the first value in `obj` which isn't JSON-serializable.
+
+    The path is a tuple of the dict keys and list indices leading to the value
+    (an empty tuple if it's `obj` itself). Return None if `obj` is
+    serializable. A container which contains itself isn't serializable, and
+    containers which occur more than once are only checked once.
+    """
+    return _find_unserializable(obj, (), set(), set())
+
+
+def _find_unserializable(obj, path, active, checked):
+    if isinstance(obj, _JSON_SCALARS):
+        return None
+    if isinstance(obj, dict):
+        items = obj.items()
+    elif isinstance(obj, (list, tuple)):
+        items = enumerate(obj)
+    else:
+        return path
+    obj_id = id(obj)
+    if obj_id in checked:
+        return None
+    # The container is already being checked further up, so it's a cycle
+    if obj_id in active:
+        return path
+    active.add(obj_id)
+    is_dict = isinstance(obj, dict)
+    for key, val in items:
+        if is_dict and not isinstance(key, _JSON_SCALARS):
+            return (*path, key)
+        found = _find_unserializable(val, (*path, key), active, checked)
+        if found is not None:
+            return found
+    active.remove(obj_id)
+    checked.add(obj_id)
+    return None
+
+
+def format_path(path):
+    """Return the path returned by `find_unserializable()` as a string."""
+    return "".join(f"[{key!r}]" for key in path)
 
 
-def make_collector(report, result):
+def make_collector(report, result, duration=None, import_duration=None):
     """Return JSON-serializable collector node."""
     collector = {
         "nodeid": report.nodeid,
@@ -26,6 +83,10 @@ def make_collector(report, result):
         # The collection report doesn't provide crash details, so we can only
         # add the message, but no traceback etc.
         collector["longrepr"] = str(report.longrepr)
+    if duration is not None:
+        collector["duration"] = duration
+    if import_duration is not None:
+        collector["import_duration"] = import_duration
     return collector
 
 
@@ -44,31 +105,151 @@ def make_collectitem(item):
     return json_item
 
 
+@dataclass(slots=True)
+class FileLoc:
+    """File location, see `_pytest._code.code.ReprFileLocation`."""
+
+    path: str
+    lineno: int
+    message: str
+
+    def to_dict(self):
+        return {"path": self.path, "lineno": self.lineno, "message": self.message}
+
+
+@dataclass(slots=True)
+class TestStage:
+    """Test stage (setup/call/teardown).
+
+    Optional fields which are None are left out of the JSON representation.
+    """
+
+    __test__ = False
+
+    duration: float
+    outcome: str
+    crash: FileLoc | None = None
+    traceback: list[FileLoc] | None = None
+    stdout: str | None = None
+    stderr: str | None = None
+    # Original sizes in bytes of the streams if they have been truncated
+    stdout_length: int | None = None
+    stderr_length: int | None = None
+    log: list | None = None
+    # Number of log records left out of `log` due to the capture limits
+    log_dropped: int | None = None
+    longrepr: str | None = None
+    # Resources used by the stage, see `--json-report-resources`
+    resources: dict | None = None
+    # Fixtures set up or torn down by the stage, see `--json-report-fixtures`
+    fixtures: list | None = None
+
+    def to_dict(self):
+        stage = {"duration": self.duration, "outcome": self.outcome}
+        if self.crash is not None:
+            stage["crash"] = self.crash.to_dict()
+        if self.traceback is not None:
+            stage["traceback"] = [loc.to_dict() for loc in self.traceback]
+        if self.stdout is not None:
+            stage["stdout"] = self.stdout
+        if self.stderr is not None:
+            stage["stderr"] = self.stderr
+        if self.stdout_length is not None:
+            stage["stdout_length"] = self.stdout_length
+        if self.stderr_length is not None:
+            stage["stderr_length"] = self.stderr_length
+        if self.log is not None:
+            stage["log"] = self.log
+        if self.log_dropped is not None:
+            stage["log_dropped"] = self.log_dropped
+        if self.longrepr is not None:
+            stage["longrepr"] = self.longrepr
+        if self.resources is not None:
+            stage["resources"] = self.resources
+        if self.fixtures is not None:
+            stage["fixtures"] = self.fixtures
+        return stage
+
+
+@dataclass(slots=True)
+class TestItem:
+    """Test item which is built up while its stages run.
+
+    The stages are `TestStage` objects or, if `pytest_json_runtest_stage` was
+    implemented by a plugin, plain dicts. Optional fields which are None are
+    left out of the JSON representation.
+    """
+
+    __test__ = False
+
+    nodeid: str
+    lineno: int | None
+    # The outcome will be overridden in case of failure
+    outcome: str = "passed"
+    keywords: list[str] | None = None
+    setup: TestStage | dict | None = None
+    call: TestStage | dict | None = None
+    teardown: TestStage | dict | None = None
+    metadata: dict | None = None
+    user_properties: list | None = None
+    # Stages with unusual names, e.g. "???" for a test whose xdist worker crashed
+    other_stages: dict | None = None
+
+    def set_stage(self, when, stage):
+        if when in STAGES:
+            setattr(self, when, stage)
+        else:
+            if self.other_stages is None:
+                self.other_stages = {}
+            self.other_stages[when] = stage
+
+    def to_dict(self):
+        item = {"nodeid": self.nodeid, "lineno": self.lineno, "outcome": self.outcome}
+        if self.keywords:
+            item["keywords"] = self.keywords
+        for when in STAGES:
+            stage = getattr(self, when)
+            if stage is not None:
+                item[when] = _stage_to_dict(stage)
+        if self.other_stages:
+            for when, stage in self.other_stages.items():
+                item[when] = _stage_to_dict(stage)
+        if self.metadata is not None:
+            item["metadata"] = self.metadata
+        if self.user_properties is not None:
+            item["user_properties"] = self.user_properties
+        return item
+
+
+def _stage_to_dict(stage):
+    return stage.to_dict() if isinstance(stage, TestStage) else stage
+
+
 def make_testitem(nodeid, keywords, location):
-    """Return JSON-serializable test item."""
-    item = {
-        "nodeid": nodeid,
-        "lineno": location[1],
-        # The outcome will be overridden in case of failure
-        "outcome": "passed",
-    }
-    if keywords:
-        item["keywords"] = keywords
-    return item
+    """Return test item."""
+    return TestItem(nodeid, location[1], keywords=keywords or None)
 
 
-def make_teststage(report, stdout, stderr, log, omit_traceback):
-    """Return JSON-serializable test stage (setup/call/teardown)."""
-    stage = {
-        "duration": report.duration,
-        "outcome": report.outcome,
-    }
+def make_teststage(
+    report,
+    stdout,
+    stderr,
+    log,
+    omit_traceback,
+    log_dropped=None,
+    stdout_length=None,
+    stderr_length=None,
+    resources=None,
+    fixtures=None,
+):
+    """Return test stage (setup/call/teardown)."""
+    stage = TestStage(report.duration, report.outcome)
     crash = getattr(report.longrepr, "reprcrash", None)
     if crash is not None:
-        stage["crash"] = make_fileloc(crash)
+        stage.crash = make_fileloc(crash)
         if not omit_traceback:
             with contextlib.suppress(AttributeError):
-                stage["traceback"] = [
+                stage.traceback = [
                     make_fileloc(x.reprfileloc) for x in report.longrepr.reprtraceback.reprentries
                 ]
                 # AttributeError happens if no detailed tb entries are available (e.g. due to
@@ -76,38 +257,103 @@ def make_teststage(report, stdout, stderr, log, omit_traceback):
                 # Then we can't provide any tb info beyond the raw error text
                 # in `longrepr`, so just pass quietly.
     if stdout:
-        stage["stdout"] = stdout
+        stage.stdout = stdout
     if stderr:
-        stage["stderr"] = stderr
+        stage.stderr = stderr
+    stage.stdout_length = stdout_length
+    stage.stderr_length = stderr_length
     if log:
-        stage["log"] = log
+        stage.log = log
+    if log_dropped:
+        stage.log_dropped = log_dropped
     # Error representation string (attr is computed property, so get only once)
     longrepr = report.longreprtext
     if longrepr:
-        stage["longrepr"] = longrepr
+        stage.longrepr = longrepr
+    stage.resources = resources
+    if fixtures:
+        stage.fixtures = fixtures
     return stage
 
 
+def truncate_stream(text, max_bytes):
+    """Return `text` truncated to about `max_bytes` bytes and its original size.
+
+    The first and the last bytes are kept (half of `max_bytes` each) and
+    joined by a marker. If `text` doesn't need to be truncated, it's returned
+    unchanged together with None.
+    """
+    # A character takes at most 4 bytes in UTF-8
+    if len(text) * 4 <= max_bytes:
+        return text, None
+    data = text.encode("utf-8", errors="surrogatepass")
+    if len(data) <= max_bytes:
+        return text, None
+    head_size = max_bytes // 2
+    tail_size = max_bytes - head_size
+    # Characters cut in half at the edges are dropped
+    head = data[:head_size].decode("utf-8", errors="ignore")
+    tail = data[len(data) - tail_size :].decode("utf-8", errors="ignore")
+    marker = f"\n[... {len(data) - head_size - tail_size} bytes truncated ...]\n"
+    return head + marker + tail, len(data)
+
+
 def make_fileloc(loc):
-    """Return JSON-serializable file location representation.
+    """Return file location.
 
     See `_pytest._code.code.ReprFileLocation`.
     """
-    return {
-        "path": loc.path,
-        "lineno": loc.lineno,
-        "message": loc.message,
-    }
+    return FileLoc(loc.path, loc.lineno, loc.message)
 
 
-def make_summary(tests, **kwargs):
-    """Return JSON-serializable test result summary."""
-    summary = Counter([t["outcome"] for t in tests.values()])
+def make_summary(tests, counts=None, durations=None, **kwargs):
+    """Return JSON-serializable test result summary.
+
+    `counts` may hold outcome counts of tests which are not in `tests`
+    anymore, e.g. because they have already been written out. `durations`
+    are the statistics of `durations.DurationStats.to_dict()`, if any.
+    """
+    summary = Counter([t.outcome for t in tests.values()])
+    if counts:
+        summary.update(counts)
     summary["total"] = sum(summary.values())
     summary.update(kwargs)
+    if durations is not None:
+        summary["durations"] = durations
     return summary
 
 
+def add_fixture_stats(stats, name, scope, setups=0, cache_hits=0, setup_time=0, teardown_time=0):
+    """Add the setups, cache hits and times of fixture `name` to `stats`.
+
+    `stats` maps the name and scope of each fixture to its totals.
+    """
+    try:
+        entry = stats[name, scope]
+    except KeyError:
+        entry = stats[name, scope] = {
+            "name": name,
+            "scope": scope,
+            "setups": 0,
+            "cache_hits": 0,
+            "setup_time": 0.0,
+            "teardown_time": 0.0,
+        }
+    entry["setups"] += setups
+    entry["cache_hits"] += cache_hits
+    entry["setup_time"] += setup_time
+    entry["teardown_time"] += teardown_time
+
+
+def make_fixtures(stats):
+    """Return the fixture table of the report, with the most expensive fixtures first."""
+    fixtures = [
+        {**entry, "total": entry["setup_time"] + entry["teardown_time"]} for entry in stats.values()
+    ]
+    fixtures.sort(key=lambda entry: entry["total"], reverse=True)
+    return fixtures
+
+
 def make_warning(warning_message, when):
     # `warning_message` is a stdlib warnings.WarningMessage object
     return {
@@ -0,0 +1,238 @@
+"""Write the results of a session to an SQLite database.
+
+Each session appends its results to normalized tables, so the results of
+many sessions can be queried together:
+
+- `sessions`: one row per session, with the JSON of its environment and summary
+- `tests`: one row per test, with its total duration over all stages
+- `stages`: one row per test stage (setup/call/teardown)
+- `crashes`: one row per failed stage, with the JSON of its traceback
+- `logs`: one row per captured log record, with the JSON of the whole record
+- `warnings`: one row per warning
+"""
+
+import json
+import sqlite3
+
+from .serialize import NON_STAGE_KEYS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    created REAL,
+    duration REAL,
+    exitcode INTEGER,
+    root TEXT,
+    environment TEXT,
+    summary TEXT
+);
+CREATE TABLE IF NOT EXISTS tests (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    nodeid TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    lineno INTEGER,
+    duration REAL,
+    keywords TEXT,
+    metadata TEXT,
+    user_properties TEXT
+);
+CREATE TABLE IF NOT EXISTS stages (
+    id INTEGER PRIMARY KEY,
+    test_id INTEGER NOT NULL REFERENCES tests (id),
+    stage TEXT NOT NULL,
+    outcome TEXT,
+    duration REAL,
+    stdout TEXT,
+    stderr TEXT,
+    longrepr TEXT
+);
+CREATE TABLE IF NOT EXISTS crashes (
+    stage_id INTEGER NOT NULL REFERENCES stages (id),
+    path TEXT,
+    lineno INTEGER,
+    message TEXT,
+    traceback TEXT
+);
+CREATE TABLE IF NOT EXISTS logs (
+    stage_id INTEGER NOT NULL REFERENCES stages (id),
+    levelno INTEGER,
+    name TEXT,
+    msg TEXT,
+    created REAL,
+    record TEXT
+);
+CREATE TABLE IF NOT EXISTS warnings (
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    message TEXT,
+    category TEXT,
+    "when" TEXT,
+    filename TEXT,
+    lineno INTEGER
+);
+CREATE INDEX IF NOT EXISTS tests_session_id ON tests (session_id);
+CREATE INDEX IF NOT EXISTS tests_nodeid ON tests (nodeid);
+CREATE INDEX IF NOT EXISTS tests_outcome ON tests (outcome);
+CREATE INDEX IF NOT EXISTS tests_duration ON tests (duration);
+CREATE INDEX IF NOT EXISTS stages_test_id ON stages (test_id);
+"""
+
+
+def _json(value):
+    return None if value is None else json.dumps(value, default=str)
+
+
+class SQLiteSink:
+    """Append the results of a session to the SQLite database at `path`.
+
+    Tests are buffered and inserted in one transaction per `batch_size` tests.
+    Like the report writers, the sink stops at the first error and raises it
+    again when finishing.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        self._batch_size = batch_size
+        self._tests = []
+        self.error = None
+        self._db = sqlite3.connect(path, isolation_level=None)
+        try:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            self._session_id = self._db.execute("INSERT INTO sessions DEFAULT VALUES").lastrowid
+        except sqlite3.Error:
+            self._db.close()
+            raise
+
+    def add_test(self, test):
+        """Add the test dict `test`, as in the `tests` list of the report."""
+        if self.error is not None:
+            return
+        self._tests.append(test)
+        if len(self._tests) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        """Insert the buffered tests."""
+        if self.error is not None or not self._tests:
+            return
+        try:
+            with self._transaction():
+                for test in self._tests:
+                    self._insert_test(test)
+        except sqlite3.Error as e:
+            self.error = e
+        self._tests.clear()
+
+    def finish(self, report):
+        """Insert the remaining tests and the session keys of `report`, and close the database."""
+        self.flush()
+        try:
+            if self.error is None:
+                with self._transaction():
+                    self._insert_session(report)
+        except sqlite3.Error as e:
+            self.error = e
+        finally:
+            self._db.close()
+        if self.error is not None:
+            raise self.error
+
+    def _transaction(self):
+        self._db.execute("BEGIN")
+        # The connection commits or rolls back when leaving the context
+        return self._db
+
+    def _insert_test(self, test):
+        stages = {
+            key: stage
+            for key, stage in test.items()
+            if key not in NON_STAGE_KEYS and isinstance(stage, dict)
+        }
+        test_id = self._db.execute(
+            "INSERT INTO tests (session_id, nodeid, outcome, lineno, duration, keywords, "
+            "metadata, user_properties) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                self._session_id,
+                test["nodeid"],
+                test.get("outcome"),
+                test.get("lineno"),
+                sum(stage.get("duration") or 0 for stage in stages.values()),
+                _json(test.get("keywords")),
+                _json(test.get("metadata")),
+                _json(test.get("user_properties")),
+            ),
+        ).lastrowid
+        for when, stage in stages.items():
+            stage_id = self._db.execute(
+                "INSERT INTO stages (test_id, stage, outcome, duration, stdout, stderr, longrepr) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    test_id,
+                    when,
+                    stage.get("outcome"),
+                    stage.get("duration"),
+                    stage.get("stdout"),
+                    stage.get("stderr"),
+                    stage.get("longrepr"),
+                ),
+            ).lastrowid
+            crash = stage.get("crash")
+            if crash:
+                self._db.execute(
+                    "INSERT INTO crashes (stage_id, path, lineno, message, traceback) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        stage_id,
+                        crash.get("path"),
+                        crash.get("lineno"),
+                        crash.get("message"),
+                        _json(stage.get("traceback")),
+                    ),
+                )
+            if stage.get("log"):
+                self._db.executemany(
+                    "INSERT INTO logs (stage_id, levelno, name, msg, created, record) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            stage_id,
+                            record.get("levelno"),
+                            record.get("name"),
+                            record.get("msg"),
+                            record.get("created"),
+                            _json(record),
+                        )
+                        for record in stage["log"]
+                    ],
+                )
+
+    def _insert_session(self, report):
+        self._db.execute(
+            "UPDATE sessions SET created = ?, duration = ?, exitcode = ?, root = ?, "
+            "environment = ?, summary = ? WHERE id = ?",
+            (
+                report.get("created"),
+                report.get("duration"),
+                report.get("exitcode"),
+                report.get("root"),
+                _json(report.get("environment")),
+                _json(report.get("summary")),
+                self._session_id,
+            ),
+        )
+        self._db.executemany(
+            'INSERT INTO warnings (session_id, message, category, "when", filename, lineno) '
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    self._session_id,
+                    warning.get("message"),
+                    warning.get("category"),
+                    warning.get("when"),
+                    warning.get("filename"),
+                    warning.get("lineno"),
+                )
+                for warning in report.get("warnings", [])
+            ],
+        )
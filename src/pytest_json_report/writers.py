@@ -0,0 +1,437 @@
+"""Writers that stream the report to a file while the session is running."""
+
+import bz2
+import errno
+import gzip
+import json
+import lzma
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+from .encoders import StdlibEncoder
+from .index import IndexBuilder, index_path
+
+# Key which tells apart the different kinds of records in a JSON Lines report
+RECORD_TYPE_KEY = "$report_type"
+
+
+def _open_gzip(path, compresslevel):
+    if compresslevel is None:
+        compresslevel = 6
+    return gzip.open(path, "wt", compresslevel=compresslevel, encoding="utf-8", newline="\n")
+
+
+def _open_xz(path, compresslevel):
+    return lzma.open(path, "wt", preset=compresslevel, encoding="utf-8", newline="\n")
+
+
+def _open_bz2(path, compresslevel):
+    if compresslevel is None:
+        compresslevel = 9
+    return bz2.open(path, "wt", compresslevel=compresslevel, encoding="utf-8", newline="\n")
+
+
+# Compressed formats by file suffix
+COMPRESSORS = {
+    ".gz": _open_gzip,
+    ".xz": _open_xz,
+    ".bz2": _open_bz2,
+}
+
+# Valid compression levels of the compressed formats by file suffix
+COMPRESSLEVELS = {
+    ".gz": range(10),
+    ".xz": range(10),
+    ".bz2": range(1, 10),
+}
+
+
+def check_compresslevel(path, compresslevel):
+    """Raise ValueError if `compresslevel` isn't valid for the format of `path`."""
+    suffix = Path(path).suffix
+    # The level is ignored for uncompressed files
+    levels = COMPRESSLEVELS.get(suffix)
+    if compresslevel is not None and levels is not None and compresslevel not in levels:
+        msg = (
+            f"invalid compression level for {suffix} files: {compresslevel} "
+            f"(must be {levels.start}-{levels.stop - 1})"
+        )
+        raise ValueError(msg)
+
+
+# Compressed formats which can be flushed partway, which a journal needs
+FLUSHABLE_COMPRESSORS = frozenset([".gz"])
+
+
+def open_report_file(path, compresslevel=None):
+    """Open `path` for writing, creating its parent directories if needed.
+
+    If `path` ends with a suffix from `COMPRESSORS`, the file is compressed
+    while writing. Newlines aren't translated (e.g. to CRLF on Windows), so
+    the byte offsets counted by the writers match the file. An invalid
+    `compresslevel` raises ValueError before the file is created.
+    """
+    check_compresslevel(path, compresslevel)
+    path = Path(path)
+    try:
+        path.parent.mkdir(parents=True)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    try:
+        opener = COMPRESSORS[path.suffix]
+    except KeyError:
+        return path.open("w", encoding="utf-8", newline="\n")
+    return opener(path, compresslevel)
+
+
+def write_report(writer, report, finish=True):
+    """Write the complete `report` dict with `writer` and finish it (if `finish`)."""
+    for key, val in report.items():
+        if key == "tests":
+            writer.start_tests()
+            for test in val:
+                writer.write_test(test)
+        else:
+            writer.write_member(key, val)
+    if finish:
+        writer.finish()
+
+
+def _byte_length(text):
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+class ReportWriter:
+    """Base class of the report writers.
+
+    A report is written by calling `write_member()` for each top-level key
+    except "tests", `start_tests()` followed by `write_test()` for each test,
+    and finally `finish()`.
+    """
+
+    def __init__(self, path, encoder=None, compresslevel=None, index=False):
+        self._path = path
+        self._file = open_report_file(path, compresslevel)
+        self._encoder = encoder or StdlibEncoder()
+        # Offsets into a compressed file are of no use, so it's never indexed
+        self._index = IndexBuilder() if index and Path(path).suffix not in COMPRESSORS else None
+        # Number of bytes written so far (before compression)
+        self._offset = 0
+        # The first error that occurred while writing. Writing stops after an
+        # error and the error is raised again when finishing the report.
+        self.error = None
+
+    @property
+    def bytes_written(self):
+        """The number of bytes written so far, before compression."""
+        return self._offset
+
+    def start_tests(self): ...
+
+    def write_test(self, test):
+        raise NotImplementedError
+
+    def write_member(self, key, value):
+        raise NotImplementedError
+
+    def finish(self):
+        """Write the rest of the report and close the file."""
+        self.close()
+        if self.error is not None:
+            raise self.error
+        if self._index is not None:
+            self._index.write(index_path(self._path))
+
+    def flush(self):
+        """Flush the data written so far to the file."""
+        if self.error is not None:
+            return
+        try:
+            self._file.flush()
+        except OSError as e:
+            self.error = e
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def _write(self, data):
+        if self.error is not None:
+            return
+        try:
+            self._file.write(data)
+        except OSError as e:
+            self.error = e
+        self._offset += _byte_length(data)
+
+    def _write_test_data(self, test, data):
+        """Write the encoded `test`, adding it to the index."""
+        if self._index is not None:
+            self._index.add(test["nodeid"], self._offset, _byte_length(data))
+        self._write(data)
+
+
+class JSONWriter(ReportWriter):
+    """Write a report in the standard format, one test at a time.
+
+    With the stdlib encoder, the output is the same as
+    `json.dump(report, f, indent=indent)` would produce for the report.
+    """
+
+    def __init__(self, path, indent=None, encoder=None, compresslevel=None, index=False):
+        super().__init__(path, encoder, compresslevel, index)
+        self._indent = indent
+        self._num_members = 0
+        self._num_tests = 0
+        self._tests_started = False
+        self._tests_open = False
+        self._write("{")
+
+    def start_tests(self):
+        if self._tests_started:
+            return
+        self._write(self._separator(self._num_members, 1) + '"tests": [')
+        self._num_members += 1
+        self._tests_started = self._tests_open = True
+
+    def write_test(self, test):
+        self.start_tests()
+        self._write(self._separator(self._num_tests, 2))
+        self._write_test_data(test, self._dumps(test, 2))
+        self._num_tests += 1
+
+    def write_member(self, key, value):
+        self._end_tests()
+        self._write(
+            self._separator(self._num_members, 1) + f"{json.dumps(key)}: {self._dumps(value, 1)}"
+        )
+        self._num_members += 1
+
+    def finish(self):
+        self._end_tests()
+        self._write((self._newline(0) if self._num_members else "") + "}")
+        super().finish()
+
+    def _end_tests(self):
+        if not self._tests_open:
+            return
+        self._tests_open = False
+        self._write((self._newline(1) if self._num_tests else "") + "]")
+
+    def _dumps(self, obj, level):
+        data = self._encoder.dumps(obj, indent=self._indent)
+        if self._indent is None:
+            return data
+        return data.replace("\n", self._newline(level))
+
+    def _separator(self, index, level):
+        """Return the separator to write before item number `index` of a container."""
+        if self._indent is None:
+            return ", " if index else ""
+        return ("," if index else "") + self._newline(level)
+
+    def _newline(self, level):
+        if self._indent is None:
+            return ""
+        return "\n" + " " * self._indent * level
+
+
+class JSONLinesWriter(ReportWriter):
+    """Write each test as one JSON line, followed by a trailing session record.
+
+    Every line is an object whose `$report_type` key is either "test" (a test
+    item as in the `tests` list of the standard report) or "session" (all
+    other keys of the standard report).
+    """
+
+    def __init__(self, path, encoder=None, compresslevel=None, index=False):
+        super().__init__(path, encoder, compresslevel, index)
+        self._session = {}
+
+    @property
+    def bytes_written(self):
+        """The number of bytes written so far, including the pending session record."""
+        if self._file.closed:
+            return self._offset
+        record = self._encoder.dumps({RECORD_TYPE_KEY: "session", **self._session})
+        return self._offset + _byte_length(record) + 1
+
+    def write_test(self, test):
+        self._write_test_data(test, self._encoder.dumps({RECORD_TYPE_KEY: "test", **test}))
+        self._write("\n")
+
+    def write_member(self, key, value):
+        self._session[key] = value
+
+    def finish(self):
+        self._write_record("session", self._session)
+        super().finish()
+
+    def _write_record(self, record_type, obj):
+        self._write(self._encoder.dumps({RECORD_TYPE_KEY: record_type, **obj}) + "\n")
+
+
+class JournalWriter(JSONLinesWriter):
+    """Write a journal of the session which can be recovered if the session is killed.
+
+    The journal is a JSON Lines report with additional records: a "journal"
+    record at the start with the session's `created` time, `root` and
+    `environment`, a "collection" record with the number of `collected`
+    tests, and a "start" record with the `nodeid` and `time` of each test
+    when it starts. Every record is flushed to the operating system right
+    away, so it survives if the process is killed, and the file is synced to
+    disk after every `sync_records` records or `sync_interval` seconds,
+    whichever comes first, so it also survives if the machine goes down.
+    """
+
+    def __init__(self, path, encoder=None, sync_records=100, sync_interval=1.0):
+        super().__init__(path, encoder)
+        self._sync_records = sync_records
+        self._sync_interval = sync_interval
+        self._num_unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def start_session(self, **info):
+        self._write_record("journal", info)
+
+    def write_collection(self, collected):
+        self._write_record("collection", {"collected": collected})
+
+    def start_test(self, nodeid, start=None):
+        """Record that test `nodeid` starts at time `start` (default now)."""
+        self._write_record("start", {"nodeid": nodeid, "time": start or time.time()})
+
+    def write_test(self, test):
+        super().write_test(test)
+        self._record_written()
+
+    def _write_record(self, record_type, obj):
+        super()._write_record(record_type, obj)
+        self._record_written()
+
+    def _record_written(self):
+        self._num_unsynced += 1
+        if (
+            self._num_unsynced >= self._sync_records
+            or time.monotonic() - self._last_sync >= self._sync_interval
+        ):
+            self.sync()
+        else:
+            self.flush()
+
+    def sync(self):
+        """Flush the journal and sync it to disk."""
+        self._num_unsynced = 0
+        self._last_sync = time.monotonic()
+        self.flush()
+        if self.error is not None:
+            return
+        try:
+            os.fsync(self._file.fileno())
+        except OSError as e:
+            self.error = e
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+        super().close()
+
+
+class ThreadedWriter:
+    """Wrap a report writer to encode and write on a background thread.
+
+    The calls are put on a queue holding at most `queue_size` calls, which the
+    thread carries out in order, so the caller only has to wait if the queue
+    is full. Values passed to the writer must not be modified afterwards.
+    Methods specific to the wrapped writer, e.g. those of `JournalWriter`, are
+    forwarded the same way. If the wrapped writer raises an exception, the
+    remaining calls are dropped and the exception is raised again by
+    `finish()`.
+    """
+
+    def __init__(self, writer, queue_size=1000):
+        self._writer = writer
+        self._queue = queue.Queue(queue_size)
+        self._exception = None
+        self._thread = threading.Thread(target=self._run, name="json-report-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def error(self):
+        return self._exception or self._writer.error
+
+    @property
+    def bytes_written(self):
+        """Wait for the queued calls, then return the wrapped writer's `bytes_written`."""
+        self._queue.join()
+        return self._writer.bytes_written
+
+    def __getattr__(self, name):
+        method = getattr(self._writer, name)
+
+        def submit(*args, **kwargs):
+            self._queue.put((method, args, kwargs))
+
+        return submit
+
+    def start_tests(self):
+        self._queue.put((self._writer.start_tests, (), {}))
+
+    def write_test(self, test):
+        self._queue.put((self._writer.write_test, (test,), {}))
+
+    def write_member(self, key, value):
+        self._queue.put((self._writer.write_member, (key, value), {}))
+
+    def flush(self):
+        self._queue.put((self._writer.flush, (), {}))
+
+    def finish(self):
+        """Wait for the queued calls, then finish the report."""
+        self._queue.put((self._writer.finish, (), {}))
+        self.close()
+        if self._exception is not None:
+            raise self._exception
+
+    def close(self):
+        """Wait for the queued calls and stop the thread, then close the file."""
+        if self._thread.is_alive():
+            # The sentinel which stops the thread
+            self._queue.put(None)
+            self._thread.join()
+        self._writer.close()
+
+    def _run(self):
+        while True:
+            call = self._queue.get()
+            if call is None:
+                self._queue.task_done()
+                return
+            # Keep taking calls off the queue after an error, so callers
+            # don't block
+            if self._exception is None:
+                method, args, kwargs = call
+                try:
+                    method(*args, **kwargs)
+                except Exception as e:  # noqa: BLE001
+                    self._exception = e
+            self._queue.task_done()
+
+
+def read_tests(path):
+    """Yield the tests of the JSON Lines report at `path`.
+
+    An incomplete last line, e.g. of a report whose writer crashed, is skipped.
+    """
+    with Path(path).open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.pop(RECORD_TYPE_KEY, None) == "test":
+                yield record
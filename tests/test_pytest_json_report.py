@@ -1,15 +1,28 @@
+import importlib
+import json
 import logging
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+from collections import Counter
 from pathlib import Path
 
 import pytest
 from rich.console import Console
 
+from pytest_json_report import cli, compact, diff, failures, serialize, writers
+from pytest_json_report.index import ReportIndex
+from pytest_json_report.overhead import BUCKET_RATIO, Overhead
 from pytest_json_report.plugin import JSONReport
 
 from .conftest import FILE, extract_tests
 
 console = Console()
 
+STAGES = ["setup", "call", "teardown"]
+
 
 def test_arguments_in_help(misc_testdir):
     res = misc_testdir.runpytest("--help")
@@ -262,6 +275,586 @@ def test_summary_only(make_json):
     assert "warnings" not in data
 
 
+@pytest.mark.parametrize("extra_args", [[], ["--json-report-stream"], ["-n=2"]])
+def test_summary_only_counts(testdir, make_json, extra_args):
+    expected = make_json(args=["--json-report"])
+    # Hooks for per-test details aren't called when only counting outcomes
+    testdir.makeconftest("""
+        def pytest_json_runtest_metadata(item, call):
+            raise AssertionError("called in summary mode")
+    """)
+    data = make_json(args=["--json-report", "--json-report-summary", *extra_args])
+    assert set(data) == {"created", "duration", "exitcode", "root", "environment", "summary"}
+    assert data["summary"] == expected["summary"]
+
+
+def test_jsonl_format(misc_testdir, num_processes, match_reports):
+    args = ["--json-report"]
+    if num_processes > 0:
+        args.append(f"-n={num_processes:d}")
+    misc_testdir.runpytest(*args)
+    misc_testdir.runpytest(*args, "--json-report-format=jsonl", "--json-report-file=report.jsonl")
+    with (Path(misc_testdir.tmpdir) / ".report.json").open(encoding="utf-8") as f:
+        expected = json.load(f)
+    with (Path(misc_testdir.tmpdir) / "report.jsonl").open(encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert {r.pop("$report_type") for r in records[:-1]} == {"test"}
+    assert records[-1].pop("$report_type") == "session"
+    data = {**records[-1], "tests": records[:-1]}
+    expected["tests"].sort(key=lambda t: t["nodeid"])
+    data["tests"].sort(key=lambda t: t["nodeid"])
+    assert data["summary"] == expected["summary"]
+    assert match_reports(data, expected)
+
+
+def test_stream(make_json, match_reports):
+    expected = make_json()
+    data = make_json(args=["--json-report", "--json-report-stream", "--json-report-indent=2"])
+    assert next(iter(data)) == "tests"
+    assert data["summary"] == expected["summary"]
+    assert match_reports(data, expected)
+
+
+@pytest.mark.parametrize("args", [["--json-report-stream"], ["--json-report-format=jsonl"]])
+def test_writer_thread(misc_testdir, match_reports, args):
+    misc_testdir.runpytest("--json-report", "--json-report-file=expected", *args)
+    misc_testdir.runpytest(
+        "--json-report",
+        "--json-report-writer-thread",
+        "--json-report-writer-queue-size=1",
+        "--json-report-journal=j.jsonl",
+        *args,
+    )
+    # Convert the reports to the standard format
+    assert cli.main(["merge", "expected", "-o", "expected.json"]) == 0
+    assert cli.main(["merge", ".report.json", "-o", "data.json"]) == 0
+    assert cli.main(["recover", "j.jsonl", "-o", "recovered.json"]) == 0
+    path = Path(misc_testdir.tmpdir)
+    expected, data, recovered = (
+        json.loads((path / name).read_text(encoding="utf-8"))
+        for name in ["expected.json", "data.json", "recovered.json"]
+    )
+    assert data["summary"] == expected["summary"]
+    assert match_reports(data, expected)
+    assert match_reports(recovered, expected)
+
+
+def test_threaded_writer_error(tmp_path):
+    class FailingEncoder:
+        def dumps(self, obj, indent=None):  # noqa: ARG002
+            raise OSError("disk full")
+
+    writer = writers.ThreadedWriter(
+        writers.JSONLinesWriter(tmp_path / "r.jsonl", encoder=FailingEncoder()), queue_size=1
+    )
+    # The queue is drained after the error, so writing doesn't block
+    for i in range(10):
+        writer.write_test({"nodeid": f"test_{i}"})
+    with pytest.raises(OSError, match="disk full"):
+        writer.finish()
+    writer.close()
+
+
+@pytest.mark.parametrize("num_processes", [0, 2])
+def test_overhead(misc_testdir, num_processes):
+    args = ["--json-report", "--json-report-overhead", f"-n={num_processes}"]
+    res = misc_testdir.runpytest(*args)
+    res.stdout.fnmatch_lines(["plugin overhead: *s in hooks, *s writing the report (* bytes)"])
+    with (Path(misc_testdir.tmpdir) / ".report.json").open(encoding="utf-8") as f:
+        data = json.load(f)
+    assert next(reversed(data)) == "plugin_overhead"
+    overhead = data["plugin_overhead"]
+    hooks = overhead["hooks"]
+    stages = [test[when] for test in data["tests"] for when in STAGES if when in test]
+    expected = {
+        "pytest_runtest_makereport",
+        "_validate_metadata",
+        "_capture_log",
+        "pytest_runtest_logreport",
+    }
+    # With xdist, the collection is only reported to the controller by node IDs
+    if not num_processes:
+        expected.add("pytest_collectreport")
+    assert set(hooks) == expected
+    assert hooks["pytest_runtest_makereport"]["count"] == len(stages)
+    assert hooks["pytest_runtest_logreport"]["count"] == len(stages)
+    num_records = sum(len(stage.get("log", [])) for stage in stages)
+    assert hooks["_capture_log"]["records"] == num_records
+    assert hooks["pytest_runtest_makereport"]["records"] == num_records
+    stream_bytes = sum(
+        len(stage[key].encode()) for stage in stages for key in ("stdout", "stderr") if key in stage
+    )
+    assert hooks["pytest_runtest_makereport"]["bytes"] >= stream_bytes > 0
+    assert hooks["pytest_runtest_logreport"]["records"] == len(stages)
+    assert hooks["pytest_runtest_logreport"]["bytes"] > 0
+    for hook in hooks.values():
+        assert 0 < hook["p50"] <= hook["p99"]
+    assert overhead["total"] == pytest.approx(sum(hook["total"] for hook in hooks.values()))
+    assert overhead["serialization"] > 0
+    size = (Path(misc_testdir.tmpdir) / ".report.json").stat().st_size
+    assert 0 < overhead["serialization_bytes"] < size
+
+
+def test_overhead_serialization_bytes(misc_testdir):
+    # The streamed tests aren't counted, only the session record (without
+    # the overhead itself)
+    misc_testdir.runpytest(
+        "--json-report",
+        "--json-report-overhead",
+        "--json-report-stream",
+        "--json-report-writer-thread",
+        "--json-report-format=jsonl",
+        "--json-report-file=r.jsonl",
+    )
+    lines = (Path(misc_testdir.tmpdir) / "r.jsonl").read_bytes().splitlines(keepends=True)
+    session = json.loads(lines[-1])
+    assert session["$report_type"] == "session"
+    overhead = session["plugin_overhead"]
+    overhead_size = len(json.dumps({"plugin_overhead": overhead}))
+    assert 0 < overhead["serialization_bytes"] < len(lines[-1]) - overhead_size
+
+
+def test_overhead_percentiles():
+    overhead = Overhead()
+    for i in range(1, 1001):
+        overhead.add("hook", i / 1000)
+    merged = Overhead()
+    merged.merge(overhead.state)
+    merged.merge(overhead.state)
+    merged.count("hook", records=3, num_bytes=100)
+    hook = merged.to_dict()["hooks"]["hook"]
+    assert hook["count"] == 2000
+    assert hook["records"] == 3
+    assert hook["bytes"] == 100
+    assert hook["total"] == pytest.approx(1001)
+    assert hook["p50"] == pytest.approx(0.5, rel=BUCKET_RATIO - 1)
+    assert hook["p99"] == pytest.approx(0.99, rel=BUCKET_RATIO - 1)
+
+
+def test_compact(misc_testdir, match_reports):
+    misc_testdir.runpytest("--json-report")
+    misc_testdir.runpytest("--json-report", "--json-report-compact", "--json-report-file=c.json")
+    misc_testdir.runpytest(
+        "--json-report",
+        "--json-report-compact",
+        "--json-report-format=jsonl",
+        "--json-report-file=c.jsonl",
+    )
+    with (Path(misc_testdir.tmpdir) / ".report.json").open(encoding="utf-8") as f:
+        expected = json.load(f)
+    with (Path(misc_testdir.tmpdir) / "c.json").open(encoding="utf-8") as f:
+        data = json.load(f)
+    with (Path(misc_testdir.tmpdir) / "c.jsonl").open(encoding="utf-8") as f:
+        records = list(compact.expand_records(json.loads(line) for line in f))
+
+    strings = data["strings"]
+    assert len(strings) == len(set(strings))
+    assert all(isinstance(i, int) for i in data["tests"][0]["nodeid"])
+    expanded = compact.expand_report(data)
+    assert match_reports(expanded, expected)
+    for test, expected_test in zip(expanded["tests"], expected["tests"], strict=True):
+        assert test["nodeid"] == expected_test["nodeid"]
+        assert test["keywords"] == expected_test["keywords"]
+        for when in ("setup", "call", "teardown"):
+            traceback = test.get(when, {}).get("traceback")
+            assert traceback == expected_test.get(when, {}).get("traceback")
+    assert {r.pop("$report_type") for r in records[:-1]} == {"test"}
+    assert records[-1].pop("$report_type") == "session"
+    assert match_reports({**records[-1], "tests": records[:-1]}, expected)
+
+
+def test_merge(misc_testdir, match_reports):
+    tmpdir = Path(misc_testdir.tmpdir)
+    misc_testdir.runpytest("--json-report")
+    misc_testdir.runpytest("--json-report", "--json-report-file=a.json", "-k", "fail")
+    misc_testdir.runpytest(
+        "--json-report",
+        "--json-report-file=b.jsonl.gz",
+        "--json-report-format=jsonl",
+        "--json-report-compact",
+        "-k",
+        "not fail",
+    )
+    assert cli.main(["merge", "a.json", "b.jsonl.gz", "-o", "m.json"]) == 0
+    with (tmpdir / ".report.json").open(encoding="utf-8") as f:
+        expected = json.load(f)
+    with (tmpdir / "m.json").open(encoding="utf-8") as f:
+        data = json.load(f)
+    # Each test is counted once, and none is deselected as each ran in one shard
+    assert data["summary"] == expected["summary"]
+    assert data["collectors"] == expected["collectors"]
+    assert data["exitcode"] == 1
+    data["tests"].sort(key=lambda t: t["nodeid"])
+    expected["tests"].sort(key=lambda t: t["nodeid"])
+    assert [t["nodeid"] for t in data["tests"]] == [t["nodeid"] for t in expected["tests"]]
+    assert match_reports(data, expected)
+
+
+def test_merge_deselected(testdir):
+    tmpdir = Path(testdir.tmpdir)
+    testdir.makepyfile("""
+        def test_one(): pass
+        def test_two(): pass
+        def test_three(): pass
+    """)
+    testdir.runpytest("--json-report", "--json-report-file=a.json", "-k", "one")
+    testdir.runpytest("--json-report", "--json-report-file=b.json", "-k", "two")
+    assert cli.main(["merge", "a.json", "b.json", "-o", "m.json"]) == 0
+    with (tmpdir / "m.json").open(encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["summary"] == {"passed": 2, "total": 2, "collected": 3, "deselected": 1}
+    (module,) = [c for c in data["collectors"] if c["nodeid"] == "test_merge_deselected.py"]
+    deselected = [item["nodeid"] for item in module["result"] if item.get("deselected")]
+    assert deselected == ["test_merge_deselected.py::test_three"]
+
+
+def test_durations_no_slowest_tests(testdir):
+    tmpdir = Path(testdir.tmpdir)
+    testdir.makepyfile("def test_foo(): pass")
+    args = ["--json-report", "--json-report-durations", "--json-report-slowest-tests=0"]
+    assert testdir.runpytest(*args, "--json-report-file=a.json").ret == 0
+    assert testdir.runpytest(*args, "--json-report-file=b.json").ret == 0
+    assert cli.main(["merge", "a.json", "b.json", "-o", "m.json"]) == 0
+    with (tmpdir / "m.json").open(encoding="utf-8") as f:
+        durations = json.load(f)["summary"]["durations"]
+    assert durations["tests"]["count"] == 2
+    assert durations["slowest_tests"] == durations["slowest_stages"] == []
+    res = testdir.runpytest("--json-report", "--json-report-slowest-tests=-1")
+    assert res.ret == pytest.ExitCode.USAGE_ERROR
+
+
+def test_merge_durations(testdir):
+    tmpdir = Path(testdir.tmpdir)
+    source = """
+        import time
+        import pytest
+
+        @pytest.mark.parametrize("i", range(2))
+        def test_sleep(i):
+            time.sleep({delay} * (i + 1))
+    """
+    testdir.makepyfile(test_a=source.format(delay=0), test_b=source.format(delay=0.1))
+    args = ["--json-report", "--json-report-durations", "--json-report-slowest-tests=2"]
+    testdir.runpytest(*args, "--json-report-file=a.json", "test_a.py")
+    testdir.runpytest(*args, "--json-report-file=b.json", "test_b.py")
+    assert cli.main(["merge", "a.json", "b.json", "-o", "m.json"]) == 0
+    inputs = []
+    for name in ["a.json", "b.json", "m.json"]:
+        with (tmpdir / name).open(encoding="utf-8") as f:
+            inputs.append(json.load(f)["summary"]["durations"])
+    a, b, merged = inputs
+    assert merged["tests"]["count"] == 4
+    assert Counter(merged["tests"]["sketch"]) == Counter(a["tests"]["sketch"]) + Counter(
+        b["tests"]["sketch"]
+    )
+    assert {t["nodeid"] for t in merged["slowest_tests"]} == {
+        "test_b.py::test_sleep[0]",
+        "test_b.py::test_sleep[1]",
+    }
+
+
+@pytest.mark.parametrize(
+    ("duplicates", "outcome"), [("last", "passed"), ("first", "failed"), ("worst", "failed")]
+)
+def test_merge_duplicates(testdir, duplicates, outcome):
+    tmpdir = Path(testdir.tmpdir)
+    testdir.makepyfile("def test_foo(): assert False")
+    testdir.runpytest("--json-report", "--json-report-file=a.json")
+    testdir.makepyfile("def test_foo(): assert True")
+    testdir.runpytest("--json-report", "--json-report-file=b.json")
+    args = ["merge", "a.json", "b.json", "-o", "m.jsonl", "--format=jsonl"]
+    assert cli.main([*args, f"--duplicates={duplicates}"]) == 0
+    with (tmpdir / "m.jsonl").open(encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [r["outcome"] for r in records[:-1]] == [outcome]
+    assert records[-1]["summary"] == {outcome: 1, "total": 1, "collected": 1}
+
+
+def test_diff(testdir, capsys):
+    tmpdir = Path(testdir.tmpdir)
+    testdir.makepyfile(test_diff="""
+        import pytest
+        def test_breaks(): pass
+        def test_fixed(): assert False
+        def test_skipped(): pass
+        def test_removed(): pass
+    """)
+    testdir.runpytest("--json-report", "--json-report-file=base.json")
+    testdir.makepyfile(test_diff="""
+        import time
+        import pytest
+        def test_breaks(): assert False
+        def test_fixed(): time.sleep(0.2)
+        def test_skipped(): pytest.skip()
+        def test_added(): pass
+    """)
+    testdir.runpytest(
+        "--json-report", "--json-report-file=head.jsonl", "--json-report-format=jsonl"
+    )
+    assert cli.main(["diff", "base.json", "head.jsonl", "--exit-code"]) == 1
+    out = capsys.readouterr().out
+    assert "test_diff.py::test_breaks (passed -> failed)" in out
+    assert out.splitlines()[-1] == (
+        "1 new failures, 1 fixed, 1 outcome changes, 1 added, 1 removed, 0 duration regressions"
+    )
+    assert cli.main(["diff", "base.json", "head.jsonl", "--json", "-o", "diff.json"]) == 0
+    with (tmpdir / "diff.json").open(encoding="utf-8") as f:
+        result = json.load(f)
+    assert result["new_failures"] == [
+        {"nodeid": "test_diff.py::test_breaks", "base": "passed", "head": "failed"}
+    ]
+    assert result["fixed"] == [
+        {"nodeid": "test_diff.py::test_fixed", "base": "failed", "head": "passed"}
+    ]
+    assert result["outcome_changes"] == [
+        {"nodeid": "test_diff.py::test_skipped", "base": "passed", "head": "skipped"}
+    ]
+    assert result["added"] == [{"nodeid": "test_diff.py::test_added", "outcome": "passed"}]
+    assert result["removed"] == [{"nodeid": "test_diff.py::test_removed", "outcome": "passed"}]
+    # A test which failed in the baseline has no duration to compare with
+    assert result["duration_regressions"] == []
+
+
+def test_diff_duration_regressions(tmp_path):
+    def write_report(name, durations):
+        tests = [
+            {"nodeid": nodeid, "outcome": "passed", "call": {"duration": duration}}
+            for nodeid, duration in durations.items()
+        ]
+        (tmp_path / name).write_text(json.dumps({"tests": tests}), encoding="utf-8")
+        return str(tmp_path / name)
+
+    head = write_report("head.json", {"steady": 1.6, "noisy": 1.6, "fast": 0.01})
+    base = write_report("base.json", {"steady": 1.0, "noisy": 1.0, "fast": 0.001})
+    # Over the relative threshold, but not the absolute one
+    assert [r["nodeid"] for r in diff.diff_reports([base], head)["duration_regressions"]] == [
+        "steady",
+        "noisy",
+    ]
+    bases = [
+        write_report(f"base{i}.json", {"steady": 1.0 + i / 100, "noisy": 0.5 + i / 2})
+        for i in range(3)
+    ]
+    (regression,) = diff.diff_reports(bases, head)["duration_regressions"]
+    assert regression["nodeid"] == "steady"
+    assert regression["base"] == pytest.approx(1.01)
+    assert regression["stdev"] == pytest.approx(0.01)
+
+
+@pytest.mark.parametrize("args", [[], ["-n=2"], ["-n=2", "--json-report-xdist-shards"]])
+def test_sqlite(misc_testdir, args):
+    for _ in range(2):
+        res = misc_testdir.runpytest("--json-report", "--json-report-sqlite=r.db", *args)
+    res.stdout.fnmatch_lines(["*results added to database: r.db*"])
+    with (Path(misc_testdir.tmpdir) / ".report.json").open(encoding="utf-8") as f:
+        report = json.load(f)
+    db = sqlite3.connect(Path(misc_testdir.tmpdir) / "r.db")
+    sessions = db.execute("SELECT id, exitcode, summary FROM sessions").fetchall()
+    assert [(id_, exitcode) for id_, exitcode, _ in sessions] == [(1, 1), (2, 1)]
+    assert json.loads(sessions[1][2]) == report["summary"]
+    tests = db.execute("SELECT nodeid, outcome FROM tests WHERE session_id = 2").fetchall()
+    assert sorted(tests) == sorted((t["nodeid"], t["outcome"]) for t in report["tests"])
+    stage = db.execute(
+        "SELECT stages.outcome, stdout, crashes.message FROM stages "
+        "JOIN tests ON tests.id = test_id JOIN crashes ON stages.id = stage_id "
+        "WHERE session_id = 2 AND nodeid LIKE '%test_fail_with_fixture' AND stage = 'call'"
+    ).fetchall()
+    assert stage == [("failed", "call\n", "assert False")]
+    db.close()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        [],
+        ["--json-report-indent=2"],
+        ["--json-report-stream"],
+        ["--json-report-format=jsonl"],
+        # Writes non-ASCII characters unescaped
+        ["--json-report-encoder=orjson"],
+    ],
+)
+def test_index(misc_testdir, capsys, args):
+    if "--json-report-encoder=orjson" in args:
+        pytest.importorskip("orjson")
+    misc_testdir.makepyfile(
+        test_unicode="""
+        import pytest
+        @pytest.mark.parametrize('x', ['ä', '€'])
+        def test_unicode(x):
+            print(x * 100)
+    """
+    )
+    misc_testdir.runpytest("--json-report", "--json-report-index", "--json-report-file=r", *args)
+    with (Path(misc_testdir.tmpdir) / "r").open(encoding="utf-8") as f:
+        if "--json-report-format=jsonl" in args:
+            tests = [json.loads(line) for line in f][:-1]
+            for test in tests:
+                del test["$report_type"]
+        else:
+            tests = json.load(f)["tests"]
+    with ReportIndex(Path(misc_testdir.tmpdir) / "r") as index:
+        assert index.num_tests == len(tests) == 12
+        for test in tests:
+            assert index[test["nodeid"]] == test
+        with pytest.raises(KeyError):
+            index["test_foo.py::test_missing"]
+
+    capsys.readouterr()
+    assert cli.main(["show", tests[-1]["nodeid"], "-r", "r"]) == 0
+    assert json.loads(capsys.readouterr().out) == tests[-1]
+    assert cli.main(["show", "test_foo.py::test_missing", "-r", "r"]) == 1
+
+
+def test_journal(misc_testdir, match_reports):
+    misc_testdir.runpytest("--json-report", "--json-report-journal=j.jsonl")
+    assert cli.main(["recover", "j.jsonl", "-o", "r.json"]) == 0
+    with (Path(misc_testdir.tmpdir) / ".report.json").open(encoding="utf-8") as f:
+        expected = json.load(f)
+    with (Path(misc_testdir.tmpdir) / "r.json").open(encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["summary"] == expected["summary"]
+    assert "in_flight" not in data
+    assert match_reports(data, expected)
+
+
+@pytest.mark.parametrize("journal", ["j.jsonl", "j.jsonl.gz"])
+def test_journal_recover_killed_session(testdir, journal):
+    testdir.makepyfile("""
+        import os
+        def test_pass():
+            pass
+        def test_fail():
+            assert False
+        def test_killed():
+            os._exit(1)
+        def test_not_run():
+            pass
+    """)
+    testdir.runpytest_subprocess(
+        "--json-report",
+        f"--json-report-journal={journal}",
+        "--json-report-journal-sync-records=1",
+    )
+    assert not (Path(testdir.tmpdir) / ".report.json").exists()
+    assert cli.main(["recover", journal, "-o", "r.jsonl", "--format=jsonl"]) == 0
+    with (Path(testdir.tmpdir) / "r.jsonl").open(encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [r["outcome"] for r in records[:-1]] == ["passed", "failed"]
+    session = records[-1]
+    assert session["exitcode"] == 2
+    assert session["in_flight"] == "test_journal_recover_killed_session.py::test_killed"
+    assert session["summary"] == {"passed": 1, "failed": 1, "total": 2, "collected": 4}
+    assert session["root"] == str(testdir.tmpdir)
+
+
+def test_journal_compressed(misc_testdir, match_reports):
+    misc_testdir.runpytest("--json-report", "--json-report-journal=j.jsonl.gz")
+    assert cli.main(["recover", "j.jsonl.gz", "-o", "r.json"]) == 0
+    with (Path(misc_testdir.tmpdir) / ".report.json").open(encoding="utf-8") as f:
+        expected = json.load(f)
+    with (Path(misc_testdir.tmpdir) / "r.json").open(encoding="utf-8") as f:
+        data = json.load(f)
+    assert match_reports(data, expected)
+    # Journals compressed with xz or bzip2 couldn't be recovered after a kill
+    res = misc_testdir.runpytest("--json-report", "--json-report-journal=j.jsonl.xz")
+    assert res.ret == pytest.ExitCode.USAGE_ERROR
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs SIGKILL")
+def test_journal_recover_killed_hanging_test(testdir):
+    # With the default sync settings, nothing is synced before the hanging
+    # test, but the records written so far must still reach the file
+    testdir.makepyfile("""
+        import time
+        import pytest
+        @pytest.mark.parametrize("i", range(5))
+        def test_fast(i):
+            pass
+        def test_hang():
+            time.sleep(60)
+    """)
+    journal = Path(testdir.tmpdir) / "j.jsonl"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "pytest", "--json-report", "--json-report-journal=j.jsonl"],
+        cwd=testdir.tmpdir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline and not (
+            journal.exists() and b"test_hang" in journal.read_bytes()
+        ):
+            time.sleep(0.05)
+    finally:
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+    assert cli.main(["recover", "j.jsonl", "-o", "r.json"]) == 0
+    with (Path(testdir.tmpdir) / "r.json").open(encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["in_flight"].endswith("::test_hang")
+    assert data["summary"] == {"passed": 5, "total": 5, "collected": 6}
+
+
+@pytest.mark.parametrize("encoder", ["orjson", "msgspec"])
+def test_encoder(make_json, match_reports, encoder):
+    pytest.importorskip(encoder)
+    content = FILE + """
+def test_odd_metadata(json_metadata):
+    json_metadata["x"] = {1: 2**70}
+"""
+    expected = make_json(content)
+    for indent in ("2", "4"):
+        data = make_json(
+            content,
+            ["--json-report", f"--json-report-encoder={encoder}", f"--json-report-indent={indent}"],
+        )
+        assert match_reports(data, expected)
+        assert extract_tests(data)["odd_metadata"]["metadata"] == {"x": {"1": 2**70}}
+
+
+def test_unavailable_encoder(testdir, monkeypatch):
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    testdir.makepyfile("def test_foo(): pass")
+    res = testdir.runpytest_inprocess("--json-report", "--json-report-encoder=orjson")
+    assert res.ret == 0
+    with (Path(testdir.tmpdir) / ".report.json").open(encoding="utf-8") as f:
+        warnings = json.load(f)["warnings"]
+    assert warnings[0]["message"].startswith("JSON encoder 'orjson' is not installed")
+
+
+@pytest.mark.parametrize("module", ["gzip", "lzma", "bz2"])
+@pytest.mark.parametrize("fmt", ["json", "jsonl"])
+def test_compressed_report(misc_testdir, module, fmt):
+    suffix = {"gzip": ".gz", "lzma": ".xz", "bz2": ".bz2"}[module]
+    path = Path(misc_testdir.tmpdir) / f"report.{fmt}{suffix}"
+    misc_testdir.runpytest(
+        "--json-report",
+        f"--json-report-file={path}",
+        f"--json-report-format={fmt}",
+        "--json-report-compresslevel=1",
+    )
+    with importlib.import_module(module).open(path, "rt", encoding="utf-8") as f:
+        if fmt == "json":
+            data = json.load(f)
+        else:
+            data = [json.loads(line) for line in f][-1]
+    assert data["summary"]["total"] == 10
+
+
+@pytest.mark.parametrize(("suffix", "level"), [(".gz", "42"), (".xz", "-1"), (".bz2", "0")])
+def test_invalid_compresslevel(misc_testdir, suffix, level):
+    res = misc_testdir.runpytest(
+        "--json-report",
+        f"--json-report-file=report.json{suffix}",
+        f"--json-report-compresslevel={level}",
+    )
+    assert res.ret == pytest.ExitCode.USAGE_ERROR
+    res.stderr.fnmatch_lines(["*invalid compression level*"])
+    assert not (Path(misc_testdir.tmpdir) / f"report.json{suffix}").exists()
+
+
 def test_report_streams(extracted_tests):
     test = extracted_tests["fail_with_fixture"]
     assert test["setup"]["stdout"] == "setup\n"
@@ -274,6 +867,286 @@ def test_report_streams(extracted_tests):
     assert "stderr" not in extracted_tests["pass"]["call"]
 
 
+def test_resources(make_json, num_processes):
+    args = ["--json-report", "--json-report-resources", "--json-report-tracemalloc"]
+    if num_processes > 0:
+        args.append(f"-n={num_processes:d}")
+    data = make_json(
+        """
+        import time
+        def test_alloc():
+            data = bytearray(10_000_000)
+            end = time.process_time() + 0.05
+            while time.process_time() < end:
+                pass
+        """,
+        args,
+    )
+    test = data["tests"][0]
+    for when in STAGES:
+        assert set(test[when]["resources"]) == {
+            "user_time",
+            "system_time",
+            "max_rss_delta",
+            "voluntary_switches",
+            "involuntary_switches",
+            "alloc_peak",
+        }
+    call = test["call"]["resources"]
+    assert call["alloc_peak"] >= 10_000_000
+    assert call["user_time"] + call["system_time"] >= 0.04
+    assert test["setup"]["resources"]["alloc_peak"] < 10_000_000
+
+
+def test_fixtures(make_json, num_processes):
+    args = ["--json-report", "--json-report-fixtures"]
+    if num_processes > 0:
+        args.append(f"-n={num_processes:d}")
+    data = make_json(
+        """
+        import time
+        import pytest
+
+        @pytest.fixture(scope="session")
+        def slow_session():
+            time.sleep(0.1)
+            yield
+            time.sleep(0.05)
+
+        @pytest.fixture
+        def fast():
+            return 1
+
+        def test_first(slow_session, fast):
+            pass
+
+        def test_second(slow_session):
+            pass
+        """,
+        args,
+    )
+    # With xdist, the tests are reported in the order they finish
+    tests = extract_tests(data)
+    first, second = tests["first"], tests["second"]
+    setup = {fixture["name"]: fixture for fixture in first["setup"]["fixtures"]}
+    assert setup["slow_session"]["scope"] == "session"
+    assert setup["slow_session"]["duration"] >= 0.1
+    assert setup["fast"]["scope"] == "function"
+    fixtures = {fixture["name"]: fixture for fixture in data["fixtures"]}
+    assert data["fixtures"][0]["name"] == "slow_session"
+    assert fixtures["fast"]["setups"] == 1
+    if num_processes == 0:
+        assert {"name": "slow_session", "scope": "session", "cached": True} in second["setup"][
+            "fixtures"
+        ]
+        # Session fixtures are torn down after the last test
+        (teardown,) = second["teardown"]["fixtures"]
+        assert teardown["name"] == "slow_session"
+        assert teardown["duration"] >= 0.05
+        assert fixtures["slow_session"]["setups"] == 1
+        assert fixtures["slow_session"]["cache_hits"] == 1
+        assert fixtures["slow_session"]["teardown_time"] >= 0.05
+        assert fixtures["slow_session"]["total"] == pytest.approx(
+            fixtures["slow_session"]["setup_time"] + fixtures["slow_session"]["teardown_time"]
+        )
+    else:
+        assert fixtures["slow_session"]["setups"] + fixtures["slow_session"]["cache_hits"] == 2
+
+
+def test_collection_timing(testdir, make_json, num_processes):
+    testdir.makepyfile(
+        test_slow="""
+        import time
+        time.sleep(0.2)
+
+        def test_slow():
+            pass
+        """
+    )
+    args = ["--json-report", "--json-report-collection-timing", "--json-report-slowest-collectors=2"]
+    if num_processes > 0:
+        args.append(f"-n={num_processes:d}")
+    data = make_json(args=args)
+    collection = data["collection"]
+    assert collection["duration"] >= 0.2
+    assert len(collection["slowest"]) == 2
+    slowest = collection["slowest"][0]
+    assert slowest["nodeid"] == "test_slow.py"
+    assert slowest["import_duration"] >= 0.2
+    assert slowest["duration"] >= slowest["import_duration"]
+    assert collection["slowest"][1]["duration"] <= slowest["duration"]
+    if num_processes == 0:
+        collectors = {collector["nodeid"]: collector for collector in data["collectors"]}
+        assert collectors["test_slow.py"]["import_duration"] == slowest["import_duration"]
+        assert "import_duration" not in collectors[""]
+        assert collectors[""]["duration"] >= 0
+
+
+def test_durations(make_json, num_processes):
+    args = ["--json-report", "--json-report-durations", "--json-report-slowest-tests=3"]
+    if num_processes > 0:
+        args.append(f"-n={num_processes:d}")
+    data = make_json(
+        """
+        import time
+        import pytest
+
+        @pytest.fixture
+        def slow_setup():
+            time.sleep(0.2)
+
+        def test_slow_setup(slow_setup):
+            pass
+
+        @pytest.mark.parametrize("i", range(10))
+        def test_fast(i):
+            pass
+        """,
+        # Only the summary is needed
+        [*args, "--json-report-summary"],
+    )
+    durations = data["summary"]["durations"]
+    tests = durations["tests"]
+    assert tests["count"] == 11
+    assert tests["p50"] < 0.1
+    assert tests["p99"] >= 0.2
+    assert sum(bin_["count"] for bin_ in tests["histogram"]) == 11
+    assert sum(tests["sketch"].values()) == 11
+    assert set(durations["stages"]) == set(STAGES)
+    assert durations["stages"]["setup"]["count"] == 11
+    assert len(durations["slowest_tests"]) == 3
+    slowest = durations["slowest_tests"][0]
+    assert slowest["nodeid"] == "test_durations.py::test_slow_setup"
+    assert slowest["duration"] >= 0.2
+    assert durations["slowest_stages"][0] == {
+        "nodeid": "test_durations.py::test_slow_setup",
+        "when": "setup",
+        "duration": durations["slowest_stages"][0]["duration"],
+    }
+    assert durations["slowest_stages"][0]["duration"] >= 0.2
+
+
+FAILURES_FILE = """
+    import pytest
+
+    @pytest.fixture
+    def broken():
+        raise RuntimeError("database is down")
+
+    @pytest.mark.parametrize("i", range(5))
+    def test_broken(broken, i):
+        pass
+
+    @pytest.mark.parametrize("i", range(2))
+    def test_assert(i):
+        assert i == -1
+"""
+
+
+def test_failures(testdir, make_json, num_processes):
+    args = ["--json-report"]
+    if num_processes > 0:
+        args.append(f"-n={num_processes:d}")
+    expected = make_json(FAILURES_FILE, args)
+    data = make_json(FAILURES_FILE, [*args, "--json-report-failures"])
+    broken, assertion = data["failures"]
+    assert broken["count"] == 5
+    assert broken["traceback"][-1]["message"] == "RuntimeError"
+    assert assertion["count"] == 2
+    assert data["summary"]["failures"] == {broken["fingerprint"]: 5, assertion["fingerprint"]: 2}
+    entries = {entry["fingerprint"]: entry for entry in data["failures"]}
+    expected_tests = {test["nodeid"]: test for test in expected["tests"]}
+    for test in data["tests"]:
+        stage = test["setup"] if "test_broken" in test["nodeid"] else test["call"]
+        assert "traceback" not in stage
+        expanded = failures.expand_test(test, entries)
+        for when in STAGES:
+            if when not in test:
+                continue
+            for key in ("crash", "traceback"):
+                assert expanded[when].get(key) == expected_tests[test["nodeid"]][when].get(key)
+    # The crash message differs from that of the first failure, so the test keeps its own
+    tests = extract_tests(data)
+    assert ("crash" in tests["assert[0]"]["call"]) != ("crash" in tests["assert[1]"]["call"])
+
+    summary = make_json(FAILURES_FILE, [*args, "--json-report-failures", "--json-report-summary"])
+    assert summary["summary"]["failures"] == data["summary"]["failures"]
+    assert summary["failures"][0]["count"] == 5
+    # With a database, the summary mode keeps the tests, which are counted at the end
+    args = [*args, "--json-report-failures", "--json-report-summary", "--json-report-sqlite=r.db"]
+    summary = make_json(FAILURES_FILE, args)
+    assert summary["summary"]["failures"] == data["summary"]["failures"]
+
+
+def test_failures_invocation_dir(testdir, monkeypatch):
+    testdir.makeini("[pytest]")
+    testdir.mkdir("sub").join("test_sub.py").write("def test_fail():\n    assert False\n")
+    args = ["--json-report", "--json-report-failures"]
+    testdir.runpytest(*args, "--json-report-file=a.json", "sub")
+    monkeypatch.chdir("sub")
+    testdir.runpytest(*args, "--json-report-file=../b.json")
+    fingerprints = []
+    for name in ("a.json", "b.json"):
+        with (Path(testdir.tmpdir) / name).open(encoding="utf-8") as f:
+            fingerprints.append(json.load(f)["summary"]["failures"])
+    assert len(fingerprints[0]) == 1
+    assert fingerprints[0] == fingerprints[1]
+
+
+def test_normalize_path():
+    root = str(Path("/proj").resolve())
+    assert failures.normalize_path("tests/test_a.py", root) == "tests/test_a.py"
+    assert failures.normalize_path("test_a.py", root, str(Path(root, "tests"))) == (
+        "tests/test_a.py"
+    )
+    assert failures.normalize_path(str(Path(root, "tests/test_a.py")), root) == "tests/test_a.py"
+    path = str(Path("/venv/lib/python3.12/site-packages/requests/api.py").resolve())
+    assert failures.normalize_path(path, root) == "requests/api.py"
+    assert failures.normalize_path("<string>", root) == "<string>"
+    assert failures.normalize_path("../lib/a.py", root, str(Path(root, "tests"))) == "lib/a.py"
+    outside = str(Path(root).parent / "other" / "a.py")
+    assert failures.normalize_path(outside, root) == "../other/a.py"
+
+
+def test_merge_failures(testdir):
+    tmpdir = Path(testdir.tmpdir)
+    testdir.makepyfile(FAILURES_FILE)
+    args = ["--json-report", "--json-report-failures"]
+    testdir.runpytest(*args, "--json-report-file=a.json", "-k", "test_broken")
+    testdir.runpytest(*args, "--json-report-file=b.jsonl", "--json-report-format=jsonl")
+    testdir.runpytest("--json-report", "--json-report-file=c.json", "-k", "test_assert")
+    assert cli.main(["merge", "a.json", "b.jsonl", "c.json", "-o", "m.json"]) == 0
+    with (tmpdir / "b.jsonl").open(encoding="utf-8") as f:
+        expected = json.loads(f.readlines()[-1])
+    with (tmpdir / "m.json").open(encoding="utf-8") as f:
+        data = json.load(f)
+    # The same fingerprints as in a report of all tests, counting the kept tests only
+    assert data["summary"]["failures"] == expected["summary"]["failures"]
+    assert all("traceback" not in test.get("setup", {}) for test in data["tests"])
+
+
+def test_streams_max_bytes(make_json):
+    data = make_json(
+        """
+        import sys
+        def test_foo():
+            print('a' * 100 + 'b' * 100)
+            print('short', file=sys.stderr)
+    """,
+        ["--json-report", "--json-report-streams-max-bytes=20"],
+    )
+    call = data["tests"][0]["call"]
+    assert call["stdout"] == "a" * 10 + "\n[... 181 bytes truncated ...]\n" + "b" * 9 + "\n"
+    assert call["stdout_length"] == 201
+    assert call["stderr"] == "short\n"
+    assert "stderr_length" not in call
+
+
+def test_streams_max_bytes_negative(misc_testdir):
+    res = misc_testdir.runpytest("--json-report", "--json-report-streams-max-bytes=-1")
+    assert res.ret == pytest.ExitCode.USAGE_ERROR
+
+
 def test_record_property(make_json, num_processes):
     data = make_json("""
         def test_record_property(record_property):
@@ -338,9 +1211,24 @@ def test_json_metadata(make_json):
     assert "metadata" not in tests_["unserializable_metadata"]
     assert len(data["warnings"]) == 1
     assert "test_unserializable_metadata is not JSON-serializable" in data["warnings"][0]["message"]
+    assert "(at metadata['a'])" in data["warnings"][0]["message"]
     assert tests_["multi_stage_metadata"]["metadata"] == {"a": 1, "b": 2, "c": 3}
 
 
+def test_find_unserializable():
+    shared = {"x": [1, 2.5, None, True, "s"]}
+    cyclic = {"a": []}
+    cyclic["a"].append(cyclic)
+    assert serialize.find_unserializable({"a": shared, "b": shared, 1: (shared,)}) is None
+    assert serialize.find_unserializable(object()) == ()
+    assert serialize.find_unserializable({"a": [1, {"b": b"x"}]}) == ("a", 1, "b")
+    assert serialize.find_unserializable({"a": {(1, 2): 3}}) == ("a", (1, 2))
+    assert serialize.find_unserializable(cyclic) == ("a", 0)
+    assert serialize.format_path(("a", 1, "b")) == "['a'][1]['b']"
+    assert serialize.serializable([shared])
+    assert not serialize.serializable(cyclic)
+
+
 def test_metadata_fixture_without_report_flag(testdir):
     """Using the json_metadata fixture without --json-report should not raise internal errors."""
     testdir.makepyfile("""
@@ -379,6 +1267,19 @@ def test_modifyreport_hook(testdir, make_json):
     assert "summary" not in data
 
 
+def test_modifyreport_hook_gets_dicts(testdir, make_json):
+    testdir.makeconftest("""
+        def pytest_json_modifyreport(json_report):
+            test = json_report['tests'][0]
+            json_report['types'] = [type(test).__name__, type(test['call']).__name__]
+    """)
+    data = make_json("""
+        def test_foo():
+            assert False
+    """)
+    assert data["types"] == ["dict", "dict"]
+
+
 def test_runtest_stage_hook(testdir, make_json):
     testdir.makeconftest("""
         def pytest_json_runtest_stage(report):
@@ -394,6 +1295,25 @@ def test_runtest_stage_hook(testdir, make_json):
     assert test["teardown"] == {"outcome": "passed"}
 
 
+def test_runtest_stage_hookwrapper(testdir, make_json):
+    testdir.makeconftest("""
+        import pytest
+        @pytest.hookimpl(hookwrapper=True)
+        def pytest_json_runtest_stage(report):
+            outcome = yield
+            outcome.get_result()['extra'] = report.when
+    """)
+    data = make_json("""
+        def test_foo():
+            assert False
+    """)
+    test = data["tests"][0]
+    for when in STAGES:
+        assert test[when]["extra"] == when
+    assert test["call"]["outcome"] == "failed"
+    assert "crash" in test["call"]
+
+
 def test_runtest_metadata_hook(testdir, make_json):
     testdir.makeconftest("""
         def pytest_json_runtest_metadata(item, call):
@@ -411,6 +1331,36 @@ def test_runtest_metadata_hook(testdir, make_json):
     assert isinstance(test["metadata"]["stop"], float)
 
 
+def test_item_metadata_hook(testdir, make_json):
+    testdir.makeconftest("""
+        import itertools
+        counter = itertools.count()
+        def pytest_json_item_metadata(item, calls):
+            return {'stages': list(calls), 'ok': calls['call'].excinfo is None, 'n': next(counter)}
+    """)
+    testdir.makepyfile(test_other="def test_other(): pass")
+    content = """
+        def test_foo():
+            assert False
+        def test_bar():
+            pass
+    """
+    tests_ = extract_tests(make_json(content, ["--json-report"]))
+    assert tests_["foo"]["metadata"]["stages"] == ["setup", "call", "teardown"]
+    assert tests_["foo"]["metadata"]["ok"] is False
+    assert tests_["bar"]["metadata"]["ok"] is True
+    assert len({test["metadata"]["n"] for test in tests_.values()}) == 3
+
+    args = ["--json-report", "--json-report-metadata-cache=module"]
+    tests_ = extract_tests(make_json(content, args))
+    assert tests_["foo"]["metadata"]["n"] == tests_["bar"]["metadata"]["n"]
+    assert tests_["other"]["metadata"]["n"] != tests_["foo"]["metadata"]["n"]
+
+    args = ["--json-report", "--json-report-metadata-cache=session"]
+    tests_ = extract_tests(make_json(content, args))
+    assert len({test["metadata"]["n"] for test in tests_.values()}) == 1
+
+
 def test_warnings(make_json, num_processes):
     warnings = make_json("""
         class TestFoo:
@@ -505,6 +1455,55 @@ def test_no_logs(make_json):
     assert "log" not in data["tests"][0]["call"]
 
 
+def test_log_capture_limits(testdir, make_json):
+    code = """
+        import logging
+        def test_foo():
+            for i in range(10):
+                logging.warning('warning %d', i)
+                logging.debug('debug %d', i)
+    """
+    data = make_json(code, ["--json-report", "--log-level=DEBUG", "--json-report-log-level=INFO"])
+    call = data["tests"][0]["call"]
+    assert [r["msg"] for r in call["log"]] == [f"warning {i}" for i in range(10)]
+    assert "log_dropped" not in call
+
+    data = make_json(
+        code,
+        [
+            "--json-report",
+            "--log-level=WARNING",
+            "--json-report-log-fields",
+            "levelname",
+            "args",
+            "--json-report-log-max-records=5",
+        ],
+    )
+    call = data["tests"][0]["call"]
+    assert [r["msg"] for r in call["log"]] == [f"warning {i}" for i in (0, 1, 7, 8, 9)]
+    assert call["log"][0] == {"levelname": "WARNING", "args": None, "msg": "warning 0"}
+    assert call["log_dropped"] == 5
+
+    # Each record is encoded as 44 bytes, e.g. {"levelname": "WARNING", "msg": "warning 0"}
+    data = make_json(
+        code,
+        [
+            "--json-report",
+            "--log-level=WARNING",
+            "--json-report-log-fields",
+            "levelname",
+            "--json-report-log-max-size=176",
+        ],
+    )
+    call = data["tests"][0]["call"]
+    assert [r["msg"] for r in call["log"]] == [f"warning {i}" for i in (0, 1, 8, 9)]
+    assert call["log_dropped"] == 6
+
+    for option in ("--json-report-log-max-records=-1", "--json-report-log-max-size=-1"):
+        res = testdir.runpytest("--json-report", option)
+        assert res.ret == pytest.ExitCode.USAGE_ERROR
+
+
 def test_no_keywords(make_json):
     data = make_json()
     assert "keywords" in data["tests"][0]
@@ -561,6 +1560,49 @@ def test_xdist(make_json, match_reports):
     assert match_reports(r2, r3)
 
 
+@pytest.mark.parametrize("args", [[], ["--json-report-stream"], ["--json-report-format=jsonl"]])
+def test_xdist_shards(misc_testdir, match_reports, args):
+    misc_testdir.runpytest("--json-report")
+    misc_testdir.runpytest(
+        "--json-report", "--json-report-xdist-shards", "--json-report-file=s.json", "-n=2", *args
+    )
+    with (Path(misc_testdir.tmpdir) / ".report.json").open(encoding="utf-8") as f:
+        expected = json.load(f)
+    with (Path(misc_testdir.tmpdir) / "s.json").open(encoding="utf-8") as f:
+        if "--json-report-format=jsonl" in args:
+            records = [json.loads(line) for line in f]
+            for record in records:
+                del record["$report_type"]
+            data = {**records[-1], "tests": records[:-1]}
+        else:
+            data = json.load(f)
+    # The tests are in collection order
+    assert [t["nodeid"] for t in data["tests"]] == [t["nodeid"] for t in expected["tests"]]
+    assert data["summary"] == expected["summary"]
+    assert match_reports(data, expected)
+    assert extract_tests(data)["fail_with_fixture"]["call"]["stdout"] == "call\n"
+
+
+def test_xdist_shards_crash(testdir):
+    testdir.makepyfile("""
+        import os
+        import pytest
+
+        @pytest.mark.parametrize("n", range(10))
+        def test_crash_one_worker(n):
+            print(n)
+            if n == 5:
+                os._exit(1)
+    """)
+    testdir.runpytest("--json-report", "--json-report-xdist-shards", "-n=2")
+    with (Path(testdir.tmpdir) / ".report.json").open(encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["summary"]["passed"] == 9
+    assert data["summary"]["failed"] == 1
+    assert len(data["tests"]) == 10
+    assert all(t["call"]["stdout"] for t in data["tests"] if t["outcome"] == "passed")
+
+
 def test_bug_31(make_json):
     data = make_json("""
         from flaky import flaky